@@ -0,0 +1,263 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import ACTUATOR_WRITES, BREAKER_OPEN, LOOP_DURATION, POLL_INTERVAL
+
+
+class Actuator:
+    """
+    Latest-value mailbox in front of a blocking fan setter.
+
+    The control loop only ever drops the newest target in here; a background task
+    pushes it out with a deadline. A slow endpoint therefore delays nothing but its
+    own writes, and targets that pile up behind it collapse into the most recent one.
+    """
+
+    def __init__(self, name, setter, timeout, breaker=None):
+        self.name = name
+        self.setter = setter
+        self.timeout = timeout
+        # Optional CircuitBreaker that hears about failed writes, only reads close it again
+        self.breaker = breaker
+        self.target = None
+        self.failed = False
+        self.changed = asyncio.Event()
+
+    def set(self, value):
+        self.target = value
+        self.changed.set()
+
+    async def run(self):
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            value = self.target
+            self.failed = True
+            ACTUATOR_WRITES.labels(self.name).inc()
+            try:
+                await asyncio.wait_for(asyncio.to_thread(self.setter, value), self.timeout)
+                self.failed = False
+            except asyncio.TimeoutError:
+                logging.warning(f"{self.name} did not accept {value}% within {self.timeout}s")
+            except Exception as e:
+                logging.error(f"Failed to set {self.name} to {value}%: {e}")
+            if self.breaker is not None and self.failed:
+                self.breaker.record(False)
+
+
+class CircuitBreaker:
+    """
+    Trips after `threshold` consecutive failures talking to one BMC.
+
+    While open, polls of that BMC are skipped; after `cooldown` seconds one trial
+    read is let through (half-open) and a success closes the breaker again.
+    """
+
+    def __init__(self, name, threshold=3, cooldown=30, clock=time.monotonic):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        return not self.open or self.clock() - self.opened_at >= self.cooldown
+
+    def record(self, ok):
+        if ok:
+            if self.open:
+                logging.info(f"{self.name} is answering again, resuming normal fan control")
+            self.failures = 0
+            self.opened_at = None
+        else:
+            self.failures += 1
+            if self.failures >= self.threshold and self.allow():
+                if not self.open:
+                    logging.error(f"{self.name} failed {self.failures} times in a row, failing safe")
+                # A failed trial restarts the cooldown, failures inside it don't extend it
+                self.opened_at = self.clock()
+        BREAKER_OPEN.labels(self.name).set(int(self.open))
+
+
+class Zone:
+    """A group of fans on one server driven by its own sensors and curve."""
+
+    def __init__(self, server, name, curve, write_timeout, breaker):
+        self.name = name
+        self.curve = curve
+        setter = functools.partial(server.update_fan_speed_percentage, zone=name)
+        self.fan = Actuator(f"{server.NAME} {name} fans", setter, write_timeout, breaker)
+        self.temp = None
+
+
+class Server:
+    """One iDRAC-managed host: a circuit breaker and one curve and actuator per fan zone."""
+
+    def __init__(self, idrac, make_curve, write_timeout, breaker):
+        self.name = idrac.NAME
+        self.idrac = idrac
+        self.breaker = breaker
+        self.zones = [Zone(idrac, name, make_curve(), write_timeout, breaker) for name in idrac.ZONES]
+
+
+class FanController:
+    """
+    Asyncio control loop driving each fan zone of every server from its own sensors,
+    and the rack exhaust fans from the hottest zone in the rack.
+
+    Sensor reads for all servers run concurrently on a bounded thread pool, and each
+    iDRAC write and Home Assistant call is its own task with its own timeout, so one
+    slow BMC or endpoint can't hold up cooling decisions for the rest. A BMC that
+    keeps failing trips its circuit breaker: its fans are set to `fail_safe_speed`
+    until it recovers, and the rack fans, since part of the rack is now unmonitored,
+    to at least that or whatever the healthy servers need.
+    """
+
+    def __init__(
+        self,
+        servers,
+        rack_fans,
+        make_server_curve,
+        rack_curve,
+        interval=5,
+        read_timeout=10,
+        ipmi_write_timeout=10,
+        hass_write_timeout=10,
+        max_workers=8,
+        scheduler=None,
+        fail_safe_speed=80,
+        breaker_threshold=3,
+        breaker_cooldown=30,
+        feedforward=None,
+    ):
+        """
+        Args:
+            servers: IDRACControl instances, one per host
+            rack_fans: RackFan instances that all follow the rack curve
+            make_server_curve: Returns a fresh FanCurve (or FanPID) for each server fan zone
+            rack_curve: FanCurve fed with the hottest reading in the rack
+            interval: Seconds between polls, unless a scheduler is given
+            read_timeout: Seconds a server's temperature read may take
+            ipmi_write_timeout: Seconds an iDRAC fan speed write may take
+            hass_write_timeout: Seconds a Home Assistant rack fan command, including its confirmation, may take
+            max_workers: Upper bound on concurrent blocking IPMI/HTTP calls
+            scheduler: Optional AdaptiveInterval that picks the poll interval from the hottest reading
+            fail_safe_speed: Fan speed used while a BMC's circuit breaker is open
+            breaker_threshold: Consecutive failures that open a BMC's circuit breaker
+            breaker_cooldown: Seconds before an open breaker lets a trial read through
+            feedforward: Optional LoadFeedForward whose bias is added to every server's readings
+        """
+        self.servers = [
+            Server(idrac, make_server_curve, ipmi_write_timeout, CircuitBreaker(idrac.NAME, breaker_threshold, breaker_cooldown))
+            for idrac in servers
+        ]
+        self.fail_safe_speed = fail_safe_speed
+        self.rack_curve = rack_curve
+        self.rack_fans = [Actuator(f"rack fan {fan.entity_id}", fan.update_fan_speed_percentage, hass_write_timeout) for fan in rack_fans]
+        self.interval = interval
+        self.read_timeout = read_timeout
+        self.max_workers = max_workers
+        self.scheduler = scheduler
+        self.feedforward = feedforward
+        self.hottest = None
+
+    async def read(self, server):
+        for zone in server.zones:
+            zone.temp = None
+        if not server.breaker.allow():
+            return
+        try:
+            temps = await asyncio.wait_for(asyncio.to_thread(server.idrac.get_zone_temps), self.read_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Temperature read from {server.name} timed out after {self.read_timeout}s, keeping its fan speed")
+            server.breaker.record(False)
+            return
+        except Exception as e:
+            logging.error(f"Temperature read from {server.name} failed, keeping its fan speed: {e}")
+            server.breaker.record(False)
+            return
+        server.breaker.record(True)
+        for zone in server.zones:
+            zone.temp = temps.get(zone.name)
+
+    @staticmethod
+    def drive(curve, actuators, temp):
+        # Only wake the actuators when the curve actually asks for a different speed,
+        # or to retry a write that didn't go through
+        speed = curve.update(temp)
+        for actuator in actuators:
+            if speed is not None:
+                actuator.set(speed)
+            elif actuator.failed:
+                actuator.set(actuator.target)
+
+    def fail_safe(self, curve, actuators, temp=None):
+        # Never below fail_safe_speed, but still follow the curve above it for whatever is still
+        # being read, so losing some sensors can't mean less cooling for the rest
+        speed = self.fail_safe_speed
+        if temp is not None:
+            curve.update(temp)
+            speed = max(speed, curve.speed)
+        if curve.speed != speed:
+            # Tell the curve where the fans are so it steps them back down once readings return
+            curve.hold(speed)
+        for actuator in actuators:
+            if actuator.target != speed or actuator.failed:
+                actuator.set(speed)
+
+    async def step(self):
+        if self.feedforward is not None:
+            self.feedforward.refresh()
+        await asyncio.gather(*(self.read(server) for server in self.servers))
+        temps = []
+        for server in self.servers:
+            if server.breaker.open:
+                for zone in server.zones:
+                    self.fail_safe(zone.curve, [zone.fan])
+                continue
+            bias = self.feedforward.bias(server.name) if self.feedforward is not None else 0.0
+            for zone in server.zones:
+                if zone.temp is not None:
+                    self.drive(zone.curve, [zone.fan], zone.temp + bias)
+                    temps.append(zone.temp + bias)
+        self.hottest = max(temps, default=None)
+        if any(server.breaker.open for server in self.servers):
+            self.fail_safe(self.rack_curve, self.rack_fans, self.hottest)
+        elif self.hottest is None:
+            logging.error("No temperature readings from any server, keeping current rack fan speed")
+        else:
+            self.drive(self.rack_curve, self.rack_fans, self.hottest)
+
+    def next_interval(self):
+        if self.scheduler is None:
+            return self.interval
+        if self.hottest is None:
+            # Flying blind, check again soon
+            return self.scheduler.min_interval
+        return self.scheduler.next(self.hottest)
+
+    async def run(self):
+        # to_thread() runs on the loop's default executor, this is what bounds concurrency
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=self.max_workers))
+        actuators = [zone.fan for server in self.servers for zone in server.zones] + self.rack_fans
+        workers = [asyncio.create_task(actuator.run()) for actuator in actuators]
+        try:
+            while True:
+                start = time.monotonic()
+                await self.step()
+                elapsed = time.monotonic() - start
+                LOOP_DURATION.observe(elapsed)
+                interval = self.next_interval()
+                POLL_INTERVAL.set(interval)
+                await asyncio.sleep(max(0, interval - elapsed))
+        finally:
+            for worker in workers:
+                worker.cancel()
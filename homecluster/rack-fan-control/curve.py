@@ -0,0 +1,55 @@
+from bisect import bisect_right
+
+
+class FanCurve:
+    """
+    Temperature to fan speed curve with hysteresis and a minimum change threshold.
+
+    Breakpoints are sorted once up front and looked up with bisect. By default the
+    curve is step-wise like the original tables; with interpolate=True speeds are
+    linearly interpolated between breakpoints. Falling temperatures only lower the
+    speed once they are `hysteresis` degrees past the point that would have raised
+    it, and changes smaller than `min_change` percent are ignored, so a temperature
+    hovering around a breakpoint doesn't translate into a stream of fan writes.
+    """
+
+    def __init__(self, points, interpolate=False, hysteresis=0.0, min_change=0, default=50):
+        self.temps, self.speeds = zip(*sorted(points.items()))
+        self.interpolate = interpolate
+        self.hysteresis = hysteresis
+        self.min_change = min_change
+        # Speed used below the lowest breakpoint until the curve has produced one
+        self.default = default
+        self.speed = None
+        # Number of speed changes issued, i.e. the actuator writes this curve caused
+        self.writes = 0
+
+    def speed_at(self, temp):
+        i = bisect_right(self.temps, temp) - 1
+        if i < 0:
+            return self.speed if self.speed is not None else self.default
+        if not self.interpolate or i == len(self.temps) - 1:
+            return self.speeds[i]
+        low_temp, high_temp = self.temps[i], self.temps[i + 1]
+        low_speed, high_speed = self.speeds[i], self.speeds[i + 1]
+        return round(low_speed + (high_speed - low_speed) * (temp - low_temp) / (high_temp - low_temp))
+
+    def update(self, temp):
+        """Feed a new temperature, returns the new speed if the fan should change or None otherwise."""
+        target = self.speed_at(temp)
+        if self.speed is not None:
+            if target < self.speed:
+                # Only come down once we're clear of the hysteresis band
+                target = max(target, min(self.speed, self.speed_at(temp + self.hysteresis)))
+            # Small adjustments aren't worth a write, but never hold back full speed
+            if abs(target - self.speed) < self.min_change and target != self.speeds[-1]:
+                target = self.speed
+            if target == self.speed:
+                return None
+        self.speed = target
+        self.writes += 1
+        return target
+
+    def hold(self, speed):
+        """The fans were forced to `speed` (fail-safe), carry on from there."""
+        self.speed = speed
@@ -1,9 +1,22 @@
+import asyncio
+import json
 import logging
 import os
-import subprocess
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+from prometheus_client import start_http_server
+
+from controller import FanController
+from curve import FanCurve
+from feedforward import LoadFeedForward
+from hass import HomeAssistantError, HomeAssistantREST, HomeAssistantWebsocket
+from ipmi import IPMIError, IPMISession
+from metrics import ERRORS, HASS_LATENCY, RACK_FAN_SPEED, SERVER_FAN_SPEED, TEMPERATURE
+from pid import FanPID
+from scheduler import AdaptiveInterval
+from sdr import aggregate, parse_sdr
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -14,93 +27,250 @@ SERVER_FAN_CURVE = {0: 15, 35: 25, 40: 30, 50: 35, 65: 40, 75: 70, CPU_WARNING_T
 
 RACK_FAN_CURVE = {40: 50, 65: 60, 75: 70, CPU_WARNING_TEMP: 85, CPU_CRITICAL_TEMP: 100}
 
+# Curve behaviour, the defaults reproduce the plain step-wise tables above
+CURVE_OPTIONS = {
+    # "curve" follows the tables, "pid" holds the temperature at the setpoint within the tables' speed range
+    "mode": os.environ.get("FAN_CONTROL_MODE", "curve"),
+    "interpolate": os.environ.get("FAN_CURVE_INTERPOLATE", "false").lower() == "true",
+    "hysteresis": float(os.environ.get("FAN_CURVE_HYSTERESIS", 0)),
+    "min_change": int(os.environ.get("FAN_CURVE_MIN_CHANGE", 0)),
+    "setpoint": float(os.environ.get("PID_SETPOINT", 70)),
+    "kp": float(os.environ.get("PID_KP", 4)),
+    "ki": float(os.environ.get("PID_KI", 0.05)),
+    # Sensors report whole degrees, so the derivative term is mostly noise unless readings are smoothed
+    "kd": float(os.environ.get("PID_KD", 0)),
+    # Percent per second the PID output may move
+    "max_rate": float(os.environ.get("PID_MAX_RATE", 2)),
+}
+
+# Which sensors the curves run on, see sdr.aggregate. "0Eh" is the first CPU, it tends to be the hottest
+TEMP_SOURCE = os.environ.get("TEMP_SOURCE", "0Eh")
+# Where the SDR repository of each BMC is dumped so ipmitool doesn't re-read it over the network every poll
+SDR_CACHE_DIR = os.environ.get("SDR_CACHE_DIR", tempfile.gettempdir())
+
 
 class IDRACControl:
-    def __init__(self, HOST, USER, PASSWORD):
+    def __init__(self, HOST, USER, PASSWORD, NAME=None, ZONES=None, TIMEOUT=10):
         # Enter ipmi ip address, username, and password
 
+        self.NAME = NAME or HOST
         self.IPADDR = HOST
         self.USER = USER
         self.PASSWORD = PASSWORD
-        self.IPMIBASE = f"ipmitool -I lanplus -H {self.IPADDR} -U {self.USER} -P {self.PASSWORD}"
+        # One ipmitool shell per BMC, kept open across polls instead of a new process each time.
+        # TIMEOUT is a hard deadline on every command so a hung BMC can't stall the loop
+        self.session = IPMISession(self.IPADDR, self.USER, self.PASSWORD, timeout=TIMEOUT)
         # Enable manual fan control
-        # subprocess.run(IPMIBASE.split() + ['0x01', '0x00'], check=True)
+        # self.session.run("raw 0x30 0x30 0x01 0x00")
 
-        # Set the IPMI tool command to adjust the fan speed
-        self.FAN_CMD = self.IPMIBASE + " raw 0x30 0x30 0x02 0xff"
+        # Set the IPMI tool command to adjust the fan speed, followed by the fan index (0xff for all) and speed
+        self.FAN_CMD = "raw 0x30 0x30 0x02"
 
-        # Initialize the fan speed and CPU temperature to 0
-        self.FAN_SPEED = 0
-        self.CPU_TEMP = 0
+        # Fan zones: which sensors (a TEMP_SOURCE selector) drive which fan indexes.
+        # The default is one zone of every fan following TEMP_SOURCE, as before
+        self.ZONES = ZONES or {"all": {"source": TEMP_SOURCE, "fans": [0xFF]}}
+
+        # Last fan speed set and CPU temperature seen, per zone
+        self.FAN_SPEED = {}
+        self.CPU_TEMP = {}
 
         # IPMI command to fetch temperatures
-        self.TEMP_CMD = f"ipmitool -I lanplus -H {self.IPADDR} -U {self.USER} -P {self.PASSWORD} sdr type temperature"
+        self.TEMP_CMD = "sdr type temperature"
+        # Every temperature sensor from the last read
+        self.SENSORS = []
+
+    def cache_sdr(self):
+        # Dump the SDR repository once and restart the shell on top of it, after this a
+        # poll only asks the BMC for the readings themselves. Called before the control loop
+        # starts: the dump can take far longer than a read is allowed to
+        path = os.path.join(SDR_CACHE_DIR, f"sdr-{self.IPADDR}.cache")
+        try:
+            self.session.run(f"sdr dump {path}", timeout=60)
+        except IPMIError as e:
+            logging.warning(f"Could not cache the SDR of {self.NAME}, reading it from the BMC every poll: {e}")
+            return
+        if not os.path.exists(path):
+            logging.warning(f"SDR dump of {self.NAME} produced no file, reading it from the BMC every poll")
+            return
+        logging.info(f"Cached SDR of {self.NAME} in {path}")
+        with self.session.lock:
+            self.session.options = ["-S", path]
+            self.session.close()
+
+    def read_sensors(self):
+        self.SENSORS = parse_sdr(self.session.run(self.TEMP_CMD))
+        for reading in self.SENSORS:
+            if reading.value is not None:
+                TEMPERATURE.labels(self.NAME, reading.label).set(reading.value)
+        return self.SENSORS
+
+    def get_zone_temps(self):
+        readings = self.read_sensors()
+        temps = {}
+        for zone, config in self.ZONES.items():
+            try:
+                NEW_CPU_TEMP = aggregate(readings, config["source"])
+            except ValueError as e:
+                logging.error(f"{self.NAME} {zone}: {e}")
+                continue
+
+            # Print the CPU temperature to the console if it has changed
+            if NEW_CPU_TEMP != self.CPU_TEMP.get(zone):
+                logging.info(f"{self.NAME} {zone} CPU Temperature: {NEW_CPU_TEMP}°C")
+                self.CPU_TEMP[zone] = NEW_CPU_TEMP
+            if NEW_CPU_TEMP >= CPU_WARNING_TEMP:
+                logging.warning(f"{self.NAME} {zone} CPU reached {NEW_CPU_TEMP}, check airflow.")
+            temps[zone] = NEW_CPU_TEMP
+        if not temps:
+            raise ValueError(f"No usable temperature readings from {self.NAME}")
+        return temps
 
     def get_current_temp(self):
-        # Read the Exhaust temperature using IPMI
-        temperature_output = subprocess.check_output(self.TEMP_CMD.split()).decode()
-        for line in temperature_output.splitlines():
-            # Parse the First CPU Temp value, it tends to be the hottest
-            if "0Eh" in line:
-                NEW_CPU_TEMP = float(line.split("|")[4].strip().split()[0])
-
-                # Print the CPU temperature to the console if it has changed
-                if NEW_CPU_TEMP != self.CPU_TEMP:
-                    logging.info(f"CPU Temperature: {NEW_CPU_TEMP}°C")
-                    self.CPU_TEMP = NEW_CPU_TEMP
-                if NEW_CPU_TEMP >= CPU_WARNING_TEMP:
-                    logging.warning(f"CPU reached {NEW_CPU_TEMP}, check airflow.")
-                break
-        return self.CPU_TEMP
-
-    def update_fan_speed_percentage(self, fan_speed):
+        return max(self.get_zone_temps().values())
+
+    def update_fan_speed_percentage(self, fan_speed, zone="all"):
         # Set the fan speed using IPMI tool if it has changed
-        if fan_speed != self.FAN_SPEED:
-            logging.info(f"Setting fan speed to {fan_speed}%")
-            NEW_FAN_SPEED_HEX = "{:02x}".format(fan_speed)
-            subprocess.run((self.FAN_CMD + f" 0x{NEW_FAN_SPEED_HEX}").split(), check=True)
-            self.FAN_SPEED = fan_speed
+        if fan_speed != self.FAN_SPEED.get(zone):
+            logging.info(f"Setting {self.NAME} {zone} fan speed to {fan_speed}%")
+            for fan in self.ZONES[zone]["fans"]:
+                self.session.run(f"{self.FAN_CMD} 0x{fan:02x} 0x{fan_speed:02x}")
+            self.FAN_SPEED[zone] = fan_speed
+            SERVER_FAN_SPEED.labels(self.NAME, zone).set(fan_speed)
 
 
 class RackFan:
-    def __init__(self, HOST, token):
-        self.HOME_ASSISTANT_URL = HOST
-        self.token = token
-        self.entity_id = "fan.rack_exhaust_fan"
+    def __init__(self, client, entity_id="fan.rack_exhaust_fan"):
+        # HomeAssistantREST or HomeAssistantWebsocket, shared by every rack fan
+        self.client = client
+        self.entity_id = entity_id
+        # Last percentage Home Assistant confirmed, like IDRACControl.FAN_SPEED
+        self.FAN_SPEED = None
+
+    def reports(self, percentage):
+        def matches(state):
+            attributes = state.get("attributes", {})
+            actual = attributes.get("percentage") or 0
+            # Fans with a few fixed speeds round the percentage to their nearest step
+            return abs(actual - percentage) <= attributes.get("percentage_step", 1) / 2
+        return matches
 
     def update_fan_speed_percentage(self, percentage):
-        url = f"{self.HOME_ASSISTANT_URL}/api/services/fan/set_percentage"
-        data = {"entity_id": self.entity_id, "percentage": percentage}
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "content-type": "application/json",
-        }
-        response = requests.post(url, headers=headers, json=data)
-        logging.info(f"Set rack fan speed to {percentage}%")
-        if response.status_code != 200:
-            print(f"Error updating Home Assistant: {response.text}")
+        if percentage == self.FAN_SPEED:
+            # With pushed states we can tell for free whether someone changed the fan behind our back
+            if not self.client.PUSHES_STATE or self.client.wait_for_state(self.entity_id, self.reports(percentage), timeout=0):
+                return
+            logging.warning(f"{self.entity_id} no longer at {percentage}%, setting it again")
+        start = time.monotonic()
+        try:
+            self.client.call_service("fan", "set_percentage", {"entity_id": self.entity_id, "percentage": percentage})
+            confirmed = self.client.wait_for_state(self.entity_id, self.reports(percentage))
+        except Exception:
+            ERRORS.labels("hass").inc()
+            self.FAN_SPEED = None
+            raise
+        finally:
+            HASS_LATENCY.labels(self.entity_id).observe(time.monotonic() - start)
+        if confirmed is None:
+            ERRORS.labels("hass").inc()
+            self.FAN_SPEED = None
+            raise HomeAssistantError(f"{self.entity_id} did not report {percentage}% after setting it")
+        logging.info(f"Set {self.entity_id} speed to {percentage}%")
+        self.FAN_SPEED = percentage
+        RACK_FAN_SPEED.labels(self.entity_id).set(percentage)
+
+
+def load_config():
+    """
+    Load the list of BMCs and rack fans to manage.
+
+    FAN_CONTROL_CONFIG points at a JSON file (see config.example.json). Without it we
+    fall back to the single IDRAC_HOST / rack_exhaust_fan setup from the environment.
+    Per-server credentials are optional and default to IDRAC_USER / IDRAC_PASSWORD.
+    """
+    path = os.environ.get("FAN_CONTROL_CONFIG")
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return {
+        "servers": [{"name": "heather", "host": os.environ.get("IDRAC_HOST")}],
+        "rack_fans": ["fan.rack_exhaust_fan"],
+    }
+
+
+def make_curve(points, options=None, clock=time.monotonic):
+    """Build a FanCurve for the table, or a FanPID bounded by its lowest and highest speeds in pid mode."""
+    options = {**CURVE_OPTIONS, **(options or {})}
+    if options["mode"] == "pid":
+        return FanPID(
+            options["setpoint"],
+            options["kp"],
+            options["ki"],
+            options["kd"],
+            min_speed=min(points.values()),
+            max_speed=max(points.values()),
+            max_rate=options["max_rate"],
+            min_change=options["min_change"],
+            critical_temp=CPU_CRITICAL_TEMP,
+            clock=clock,
+        )
+    return FanCurve(points, options["interpolate"], options["hysteresis"], options["min_change"])
 
 
 if __name__ == "__main__":
-    heather = IDRACControl(HOST=os.environ.get("IDRAC_HOST"), USER=os.environ.get("IDRAC_USER"), PASSWORD=os.environ.get("IDRAC_PASSWORD"))
-    rack_fan = RackFan(HOST=os.environ.get("HASS_HOST"), token=os.environ.get("HASS_TOKEN"))
-
-    NEW_SERVER_FAN_SPEED = 50
-    NEW_RACK_FAN_SPEED = 50
-    while True:
-        cpu_temp = heather.get_current_temp()
-        # Find the fan speed corresponding to the current temperature
-        for TEMP, SPEED in sorted(SERVER_FAN_CURVE.items()):
-            if cpu_temp >= TEMP:
-                NEW_SERVER_FAN_SPEED = SPEED
-            else:
-                break
-        heather.update_fan_speed_percentage(NEW_SERVER_FAN_SPEED)
-        # Find the fan speed corresponding to the current temperature
-        for TEMP, SPEED in sorted(RACK_FAN_CURVE.items()):
-            if cpu_temp >= TEMP:
-                NEW_RACK_FAN_SPEED = SPEED
-            else:
-                break
-        rack_fan.update_fan_speed_percentage(NEW_RACK_FAN_SPEED)
-        time.sleep(5)
+    config = load_config()
+    start_http_server(int(os.environ.get("METRICS_PORT", 9101)))
+    servers = [
+        IDRACControl(
+            HOST=server["host"],
+            USER=server.get("user", os.environ.get("IDRAC_USER")),
+            PASSWORD=server.get("password", os.environ.get("IDRAC_PASSWORD")),
+            NAME=server.get("name"),
+            ZONES=server.get("zones"),
+            TIMEOUT=float(os.environ.get("IPMI_TIMEOUT", 10)),
+        )
+        for server in config["servers"]
+    ]
+    # Outside the per-read deadline, and all BMCs at once
+    with ThreadPoolExecutor(max_workers=int(config.get("max_workers", 8))) as pool:
+        list(pool.map(IDRACControl.cache_sdr, servers))
+    scheduler = None
+    if os.environ.get("ADAPTIVE_POLLING", "false").lower() == "true":
+        scheduler = AdaptiveInterval(
+            min_interval=float(os.environ.get("POLL_INTERVAL_MIN", 1)),
+            max_interval=float(os.environ.get("POLL_INTERVAL_MAX", 60)),
+            warning_temp=CPU_WARNING_TEMP,
+        )
+    # One Home Assistant connection for every rack fan
+    if os.environ.get("HASS_WEBSOCKET", "false").lower() == "true":
+        hass = HomeAssistantWebsocket(os.environ.get("HASS_HOST"), os.environ.get("HASS_TOKEN"))
+    else:
+        hass = HomeAssistantREST(os.environ.get("HASS_HOST"), os.environ.get("HASS_TOKEN"))
+    rack_fans = [RackFan(hass, entity_id=entity_id) for entity_id in config["rack_fans"]]
+
+    # Optional feed-forward from node CPU utilisation, e.g. the Prometheus in rackspace/apps/monitoring
+    feedforward = None
+    if os.environ.get("PROMETHEUS_URL"):
+        feedforward = LoadFeedForward(
+            os.environ["PROMETHEUS_URL"],
+            instances={idrac.NAME: server.get("prometheus_instance", idrac.NAME) for idrac, server in zip(servers, config["servers"])},
+            gain=float(os.environ.get("LOAD_GAIN", 10)),
+        )
+
+    controller = FanController(
+        servers,
+        rack_fans,
+        make_server_curve=lambda: make_curve(SERVER_FAN_CURVE),
+        rack_curve=make_curve(RACK_FAN_CURVE),
+        interval=float(os.environ.get("POLL_INTERVAL", 5)),
+        read_timeout=float(os.environ.get("IPMI_TIMEOUT", 10)),
+        # Each backend has its own deadline, tuning one doesn't change the other
+        ipmi_write_timeout=float(os.environ.get("IPMI_TIMEOUT", 10)),
+        hass_write_timeout=float(os.environ.get("HASS_TIMEOUT", 10)),
+        max_workers=int(config.get("max_workers", 8)),
+        scheduler=scheduler,
+        fail_safe_speed=int(os.environ.get("FAIL_SAFE_SPEED", 80)),
+        breaker_threshold=int(os.environ.get("BREAKER_THRESHOLD", 3)),
+        breaker_cooldown=float(os.environ.get("BREAKER_COOLDOWN", 30)),
+        feedforward=feedforward,
+    )
+    asyncio.run(controller.run())
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+import requests
+
+from metrics import ERRORS, LOAD_BIAS
+
+# Busy fraction of every CPU on each node, from node-exporter
+DEFAULT_QUERY = '1 - avg by (instance) (rate(node_cpu_seconds_total{mode="idle"}[1m]))'
+
+
+class LoadFeedForward:
+    """
+    Feed-forward term from cluster CPU utilisation, so fans spin up with the load
+    instead of waiting for the heat to reach the sensors.
+
+    Utilisation is fetched from Prometheus in the background and cached; the control
+    loop only ever reads the cache, so a slow or unreachable Prometheus costs nothing
+    but the feed-forward itself. The term is expressed in degrees: a server at
+    `utilisation` is treated as `gain * utilisation` °C hotter than it reads, which
+    works the same for the step curves and the PID.
+    """
+
+    def __init__(self, url, instances, gain=10.0, query=DEFAULT_QUERY, refresh_interval=15, max_age=60, timeout=2):
+        """
+        Args:
+            url: Prometheus base URL, e.g. http://prometheus-server.monitoring.svc
+            instances: Server name -> Prometheus instance label (the port is ignored)
+            gain: Degrees added at 100% utilisation
+            refresh_interval: Seconds between queries
+            max_age: Seconds after which cached utilisation is ignored
+        """
+        self.url = url.rstrip("/")
+        self.instances = instances
+        self.gain = gain
+        self.query = query
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.utilisation = {}
+        self.updated_at = None
+        self.attempted_at = None
+        self.task = None
+
+    def fetch(self):
+        response = self.session.get(f"{self.url}/api/v1/query", params={"query": self.query}, timeout=self.timeout)
+        response.raise_for_status()
+        return {
+            result["metric"].get("instance", "").split(":")[0]: float(result["value"][1])
+            for result in response.json()["data"]["result"]
+        }
+
+    async def _refresh(self):
+        try:
+            self.utilisation = await asyncio.wait_for(asyncio.to_thread(self.fetch), self.timeout)
+            self.updated_at = time.monotonic()
+        except asyncio.TimeoutError:
+            ERRORS.labels("prometheus").inc()
+            logging.warning(f"Prometheus did not answer within {self.timeout}s, keeping cached utilisation")
+        except Exception as e:
+            ERRORS.labels("prometheus").inc()
+            logging.warning(f"Could not fetch utilisation from Prometheus: {e}")
+
+    def refresh(self):
+        """Start a background refresh if one is due, never waits for it."""
+        if self.task is not None and not self.task.done():
+            return
+        if self.attempted_at is not None and time.monotonic() - self.attempted_at < self.refresh_interval:
+            return
+        self.attempted_at = time.monotonic()
+        self.task = asyncio.create_task(self._refresh())
+
+    def bias(self, server):
+        """Degrees to add to this server's readings, 0 if there's no recent utilisation for it."""
+        if self.updated_at is None or time.monotonic() - self.updated_at > self.max_age:
+            bias = 0.0
+        else:
+            bias = self.gain * self.utilisation.get(self.instances.get(server, server), 0.0)
+        LOAD_BIAS.labels(server).set(bias)
+        return bias
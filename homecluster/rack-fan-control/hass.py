@@ -0,0 +1,186 @@
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from websockets.sync.client import connect as websocket_connect
+except ImportError:  # Only needed with HASS_WEBSOCKET=true
+    websocket_connect = None
+
+
+class HomeAssistantError(Exception):
+    """Raised when Home Assistant rejects a call or doesn't answer in time."""
+
+
+class HomeAssistantREST:
+    """Home Assistant REST API over one keep-alive session shared by every entity."""
+
+    # States have to be fetched, nothing tells us when they change
+    PUSHES_STATE = False
+
+    def __init__(self, url, token, timeout=5):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount(self.url, HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "content-type": "application/json",
+        })
+
+    def call_service(self, domain, service, data):
+        response = self.session.post(f"{self.url}/api/services/{domain}/{service}", json=data, timeout=self.timeout)
+        if response.status_code != 200:
+            raise HomeAssistantError(f"{domain}.{service} returned {response.status_code}: {response.text}")
+
+    def wait_for_state(self, entity_id, predicate, timeout=None):
+        """
+        Poll the entity's state until predicate accepts it, returns None on timeout.
+
+        Devices such as ESPHome fans report their new state a moment after the service
+        call returns, so the first fetch often still sees the old one.
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        delay = 0.1
+        while True:
+            response = self.session.get(f"{self.url}/api/states/{entity_id}", timeout=self.timeout)
+            if response.status_code != 200:
+                raise HomeAssistantError(f"Reading {entity_id} returned {response.status_code}: {response.text}")
+            state = response.json()
+            if predicate(state):
+                return state
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 1.0)
+
+
+class HomeAssistantWebsocket:
+    """
+    Home Assistant websocket API over a single persistent, authenticated connection.
+
+    Service calls are multiplexed over the socket, and the entities we control are
+    subscribed to with `subscribe_entities`, so Home Assistant pushes their state to
+    us and confirming a command doesn't cost another request. The connection is
+    re-established on the next call if it drops.
+    """
+
+    PUSHES_STATE = True
+
+    def __init__(self, url, token, timeout=5):
+        if websocket_connect is None:
+            raise HomeAssistantError("The websockets package is required for the Home Assistant websocket API")
+        # http://host -> ws://host, https://host -> wss://host
+        self.ws_url = "ws" + url.rstrip("/")[len("http"):] + "/api/websocket"
+        self.token = token
+        self.timeout = timeout
+        self.ws = None
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.watched = set()
+        self.states = {}
+        self.lock = threading.Lock()
+        self.updated = threading.Condition()
+
+    def connect(self):
+        logging.info(f"Connecting to {self.ws_url}")
+        ws = websocket_connect(self.ws_url, open_timeout=self.timeout)
+        ws.recv(timeout=self.timeout)  # auth_required
+        ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+        reply = json.loads(ws.recv(timeout=self.timeout))
+        if reply.get("type") != "auth_ok":
+            ws.close()
+            raise HomeAssistantError(f"Home Assistant refused the token: {reply.get('message', reply)}")
+        self.ws = ws
+        with self.updated:
+            self.states = {}
+        threading.Thread(target=self._reader, args=(ws,), daemon=True).start()
+        for entity_id in self.watched:
+            self._send({"type": "subscribe_entities", "entity_ids": [entity_id]})
+
+    def _reader(self, ws):
+        try:
+            for raw in ws:
+                message = json.loads(raw)
+                if message["type"] == "result":
+                    future = self.pending.pop(message["id"], None)
+                    if future is None:
+                        continue
+                    if message.get("success"):
+                        future.set_result(message.get("result"))
+                    else:
+                        future.set_exception(HomeAssistantError(message.get("error")))
+                elif message["type"] == "event":
+                    self._apply_entity_event(message["event"])
+        except Exception as e:
+            logging.warning(f"Home Assistant websocket closed: {e}")
+        finally:
+            with self.lock:
+                if self.ws is ws:
+                    self.ws = None
+                for future in self.pending.values():
+                    future.set_exception(HomeAssistantError("Home Assistant websocket closed"))
+                self.pending.clear()
+
+    def _apply_entity_event(self, event):
+        # subscribe_entities sends compressed states: "a" adds full states, "c" carries diffs
+        with self.updated:
+            for entity_id, state in event.get("a", {}).items():
+                self.states[entity_id] = {"state": state.get("s"), "attributes": dict(state.get("a", {}))}
+            for entity_id, change in event.get("c", {}).items():
+                current = self.states.setdefault(entity_id, {"state": None, "attributes": {}})
+                added = change.get("+", {})
+                if "s" in added:
+                    current["state"] = added["s"]
+                current["attributes"].update(added.get("a", {}))
+                for key in change.get("-", {}).get("a", []):
+                    current["attributes"].pop(key, None)
+            for entity_id in event.get("r", []):
+                self.states.pop(entity_id, None)
+            self.updated.notify_all()
+
+    def _send(self, message):
+        message["id"] = next(self.ids)
+        future = Future()
+        self.pending[message["id"]] = future
+        self.ws.send(json.dumps(message))
+        return future
+
+    def _request(self, message):
+        with self.lock:
+            if self.ws is None:
+                self.connect()
+            future = self._send(message)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HomeAssistantError(f"No reply to {message['type']} within {self.timeout}s") from None
+
+    def call_service(self, domain, service, data):
+        data = dict(data)
+        target = {"entity_id": data.pop("entity_id")} if "entity_id" in data else {}
+        self._request({"type": "call_service", "domain": domain, "service": service, "service_data": data, "target": target})
+
+    def wait_for_state(self, entity_id, predicate, timeout=None):
+        """Wait for a pushed state of the entity that predicate accepts, returns None on timeout."""
+        if entity_id not in self.watched:
+            self._request({"type": "subscribe_entities", "entity_ids": [entity_id]})
+            self.watched.add(entity_id)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self.updated:
+            while True:
+                state = self.states.get(entity_id)
+                if state is not None and predicate(state):
+                    return state
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.updated.wait(remaining)
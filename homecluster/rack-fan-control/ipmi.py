@@ -0,0 +1,175 @@
+import logging
+import os
+import secrets
+import selectors
+import shutil
+import subprocess
+import threading
+import time
+
+from metrics import ERRORS, IPMI_LATENCY
+
+# Every command written to the shell is followed by an `echo` of this marker, plus a
+# nonce per command, so we know exactly where its output ends regardless of how
+# ipmitool draws its prompt or whether it echoes what we type.
+SENTINEL = "__IPMI_CMD_DONE__"
+
+# Output that means the RMCP+ session is gone and the shell has to be restarted.
+SESSION_ERRORS = (
+    "Unable to establish IPMI v2 / RMCP+ session",
+    "Error: Unable to establish LAN session",
+    "Close Session command failed",
+    "Invalid Session Handle",
+)
+
+# Output of a single command the BMC or ipmitool rejected. The session itself is fine,
+# but the command didn't happen, e.g. "Unable to send RAW command (...): Invalid command"
+COMMAND_ERRORS = (
+    "Unable to send RAW command",
+    "Invalid command",
+    "Insufficient privilege level",
+)
+
+
+class IPMIError(Exception):
+    """Raised when an IPMI command fails or the BMC does not answer in time."""
+
+
+class IPMICommandError(IPMIError):
+    """Raised when the BMC rejects a command; the session is still usable."""
+
+
+class IPMISession:
+    """
+    Long-lived `ipmitool -I lanplus shell` co-process.
+
+    The shell keeps one RMCP+ session open with the BMC, so every command after the
+    first skips the handshake and authentication round trips that a fresh ipmitool
+    process would pay. If the shell dies, hangs past the timeout or reports a lost
+    session, it is killed and transparently restarted on the next command.
+    """
+
+    def __init__(self, host, user, password, timeout=10.0):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        # Extra global ipmitool options, e.g. ["-S", path] for a local SDR cache
+        self.options = []
+        self.proc = None
+        self.last_latency = 0.0
+        # The shell is a single stream, callers on different threads have to take turns
+        self.lock = threading.Lock()
+
+    def _command(self):
+        # -E reads the password from IPMI_PASSWORD so it doesn't show up in `ps`
+        cmd = ["ipmitool", "-I", "lanplus", "-H", self.host, "-U", self.user, "-E"] + self.options + ["shell"]
+        # ipmitool block-buffers stdout when it isn't a tty, force line buffering
+        if shutil.which("stdbuf"):
+            cmd = ["stdbuf", "-oL", "-eL"] + cmd
+        return cmd
+
+    def connect(self):
+        self.close()
+        logging.info(f"Opening IPMI session to {self.host}")
+        env = dict(os.environ, IPMI_PASSWORD=self.password or "")
+        self.proc = subprocess.Popen(
+            self._command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env,
+        )
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            if self.proc.poll() is None:
+                self.proc.stdin.write(b"quit\n")
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=0.5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    def _read_until_sentinel(self, sentinel, echoed, timeout):
+        """
+        Collect output lines until one that is exactly `sentinel` once the prompt is dropped.
+
+        Lines in `echoed` are the input we wrote, which a shell that echoes it prints
+        back; they're left out of the output.
+        """
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        buffer = b""
+        lines = []
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while True:
+                while b"\n" in buffer:
+                    raw, buffer = buffer.split(b"\n", 1)
+                    # Drop the prompt ipmitool prints in front of each response
+                    line = raw.decode(errors="replace").rstrip("\r").replace("ipmitool> ", "")
+                    if line.strip() == sentinel:
+                        return "\n".join(lines)
+                    if line.strip() not in echoed:
+                        lines.append(line)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise IPMIError(f"Timed out after {timeout}s waiting for {self.host}")
+                if not selector.select(remaining):
+                    continue
+                chunk = os.read(fd, 4096)
+                if not chunk:
+                    raise IPMIError(f"IPMI shell for {self.host} exited unexpectedly")
+                buffer += chunk
+
+    def _run_once(self, command, timeout):
+        if self.proc is None or self.proc.poll() is not None:
+            self.connect()
+        sentinel = f"{SENTINEL}{secrets.token_hex(4)}"
+        self.proc.stdin.write(f"{command}\necho {sentinel}\n".encode())
+        self.proc.stdin.flush()
+        output = self._read_until_sentinel(sentinel, {command.strip(), f"echo {sentinel}"}, timeout)
+        if any(error in output for error in SESSION_ERRORS):
+            raise IPMIError(f"IPMI session to {self.host} lost: {output.strip()}")
+        rejected = [line.strip() for line in output.splitlines() if any(error in line for error in COMMAND_ERRORS)]
+        if rejected:
+            raise IPMICommandError(f"{self.host} rejected {command!r}: {rejected[0]}")
+        return output
+
+    def run(self, command, timeout=None):
+        """
+        Run a single ipmitool command (e.g. "sdr type temperature") in the shell.
+
+        timeout is a hard deadline for the whole call: if the first attempt fails early
+        enough, it is retried once on a fresh session within whatever time is left,
+        otherwise IPMIError is raised. A command the BMC rejects raises IPMICommandError
+        straight away and keeps the session.
+        """
+        timeout = timeout or self.timeout
+        with self.lock:
+            start = time.monotonic()
+            deadline = start + timeout
+            for attempt in range(2):
+                try:
+                    output = self._run_once(command, deadline - time.monotonic())
+                    break
+                except IPMICommandError:
+                    # The BMC answered, a new session would only be rejected the same way
+                    ERRORS.labels("ipmi").inc()
+                    raise
+                except (IPMIError, OSError) as e:
+                    ERRORS.labels("ipmi").inc()
+                    # Whatever state the shell is in, it can't be trusted anymore
+                    self.close()
+                    # Reconnecting takes a handshake, don't bother if that can't fit in the deadline
+                    if attempt or deadline - time.monotonic() < timeout / 2:
+                        raise IPMIError(str(e)) from e
+                    logging.warning(f"{e}, reconnecting")
+            self.last_latency = time.monotonic() - start
+        IPMI_LATENCY.labels(self.host, command.split()[0]).observe(self.last_latency)
+        logging.debug(f"ipmitool {command!r} took {self.last_latency * 1000:.0f}ms")
+        return output
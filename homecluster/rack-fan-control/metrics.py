@@ -0,0 +1,18 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Buckets sized for BMC and Home Assistant round trips: a warm IPMI session answers in
+# tens of milliseconds, a cold one or a struggling iDRAC takes seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+TEMPERATURE = Gauge("fan_control_temperature_celsius", "Temperature sensor readings from the BMC", ["server", "sensor"])
+SERVER_FAN_SPEED = Gauge("fan_control_server_fan_percent", "Fan speed last commanded to a server fan zone", ["server", "zone"])
+RACK_FAN_SPEED = Gauge("fan_control_rack_fan_percent", "Fan speed last commanded to the rack fan", ["entity"])
+ACTUATOR_WRITES = Counter("fan_control_actuator_writes_total", "Fan speed commands sent, including failed ones", ["actuator"])
+IPMI_LATENCY = Histogram("fan_control_ipmi_seconds", "ipmitool command latency", ["server", "command"], buckets=LATENCY_BUCKETS)
+HASS_LATENCY = Histogram("fan_control_hass_seconds", "Home Assistant call latency", ["entity"], buckets=LATENCY_BUCKETS)
+ERRORS = Counter("fan_control_errors_total", "Failed IPMI commands, Home Assistant calls and Prometheus queries", ["kind"])
+LOOP_DURATION = Histogram("fan_control_loop_seconds", "Time spent on one control loop iteration", buckets=LATENCY_BUCKETS)
+
+POLL_INTERVAL = Gauge("fan_control_poll_interval_seconds", "Delay chosen before the next poll")
+BREAKER_OPEN = Gauge("fan_control_breaker_open", "1 while a BMC's circuit breaker is open and its fans are failing safe", ["server"])
+LOAD_BIAS = Gauge("fan_control_load_bias_celsius", "Feed-forward degrees added to a server's readings from its CPU utilisation", ["server"])
@@ -0,0 +1,84 @@
+import time
+
+
+class FanPID:
+    """
+    PID alternative to FanCurve that holds the temperature at a setpoint.
+
+    It has the same interface as FanCurve (update() returns a new speed or None, plus
+    `speed` and `writes`), so FanController drives either one. Instead of jumping
+    between table levels the output settles on whatever speed holds the setpoint,
+    which means fewer commands and usually less fan than the step just above it.
+
+    - The derivative acts on the measurement rather than the error, so there is no
+      kick when the setpoint changes.
+    - Anti-windup: the integral stops growing while the output is pinned at min/max
+      in the direction the error is pushing.
+    - The output moves at most `max_rate` percent per second, and changes smaller
+      than `min_change` aren't sent.
+    - At or above `critical_temp` the fan goes straight to `max_speed`.
+    """
+
+    def __init__(self, setpoint, kp, ki, kd, min_speed, max_speed=100, max_rate=5.0, min_change=0, critical_temp=None, clock=time.monotonic):
+        self.setpoint = setpoint
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.max_rate = max_rate
+        self.min_change = min_change
+        self.critical_temp = critical_temp
+        self.clock = clock
+        self.integral = 0.0
+        self.output = None
+        self.last_temp = None
+        self.last_time = None
+        self.speed = None
+        self.writes = 0
+
+    def update(self, temp):
+        """Feed a new temperature, returns the new speed if the fan should change or None otherwise."""
+        now = self.clock()
+        dt = now - self.last_time if self.last_time is not None else 0.0
+        error = temp - self.setpoint
+        derivative = (temp - self.last_temp) / dt if dt > 0 else 0.0
+
+        integral = self.integral + error * dt
+        raw = self.min_speed + self.kp * error + self.ki * integral + self.kd * derivative
+        saturated = (raw > self.max_speed and error > 0) or (raw < self.min_speed and error < 0)
+        if saturated:
+            raw = self.min_speed + self.kp * error + self.ki * self.integral + self.kd * derivative
+        else:
+            self.integral = integral
+
+        target = min(self.max_speed, max(self.min_speed, raw))
+        if self.output is not None and dt > 0:
+            step = self.max_rate * dt
+            target = min(self.output + step, max(self.output - step, target))
+        if self.critical_temp is not None and temp >= self.critical_temp:
+            target = self.max_speed
+        self.output = target
+        self.last_temp, self.last_time = temp, now
+
+        speed = round(target)
+        if self.speed is not None:
+            if speed == self.speed or (abs(speed - self.speed) < self.min_change and speed != self.max_speed):
+                return None
+        self.speed = speed
+        self.writes += 1
+        return speed
+
+    def hold(self, speed):
+        """
+        The fans were forced to `speed` (fail-safe), carry on from there.
+
+        The output and integral are reset rather than resumed, so control restarts
+        from the forced speed instead of whatever it had wound up to before, and the
+        rate limit counts from now.
+        """
+        self.speed = speed
+        self.output = float(speed)
+        self.integral = 0.0
+        if self.last_time is not None:
+            self.last_time = self.clock()
@@ -0,0 +1,37 @@
+import time
+
+
+class AdaptiveInterval:
+    """
+    Picks the delay before the next poll from how the temperature is moving.
+
+    While the temperature is climbing faster than `rate_threshold` °C/s, or is within
+    `warning_margin` degrees of the warning temperature, we poll every `min_interval`
+    seconds. Once it's flat or falling the interval grows by `backoff` each poll until
+    it reaches `max_interval`, which keeps steady-state BMC traffic down.
+    """
+
+    def __init__(self, min_interval=1, max_interval=60, warning_temp=80, warning_margin=10, rate_threshold=0.05, backoff=1.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.warning_temp = warning_temp
+        self.warning_margin = warning_margin
+        self.rate_threshold = rate_threshold
+        self.backoff = backoff
+        self.interval = min_interval
+        self.last_temp = None
+        self.last_time = None
+
+    def next(self, temp, now=None):
+        now = time.monotonic() if now is None else now
+        rate = 0.0
+        if self.last_temp is not None and now > self.last_time:
+            rate = (temp - self.last_temp) / (now - self.last_time)
+        self.last_temp, self.last_time = temp, now
+
+        if rate > self.rate_threshold or temp >= self.warning_temp - self.warning_margin:
+            self.interval = self.min_interval
+        elif rate >= -self.rate_threshold:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        # Cooling down quickly: keep the current pace until it settles
+        return self.interval
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class SensorReading:
+    """One line of `ipmitool sdr type temperature`, e.g. "Temp | 0Eh | ok | 3.1 | 52 degrees C"."""
+
+    name: str
+    sensor_id: str
+    status: str
+    entity: str
+    value: float | None
+
+    @property
+    def kind(self):
+        # Entity 3.x is a processor, the rest are told apart by the names Dell gives them
+        if self.entity.startswith("3."):
+            return "cpu"
+        if "inlet" in self.name.lower():
+            return "inlet"
+        if "exhaust" in self.name.lower():
+            return "exhaust"
+        return "other"
+
+    @property
+    def label(self):
+        return f"{self.name} {self.sensor_id}"
+
+
+def parse_sdr(output):
+    """Parse every temperature sensor out of `sdr type temperature` output in one pass."""
+    readings = []
+    for line in output.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) != 5:
+            continue
+        name, sensor_id, status, entity, reading = fields
+        # Absent sensors (empty sockets, "ns") report "No Reading" or "Disabled"
+        value = float(reading.split()[0]) if reading.endswith("degrees C") else None
+        readings.append(SensorReading(name, sensor_id, status, entity, value))
+    return readings
+
+
+def aggregate(readings, source):
+    """
+    Reduce sensor readings to the single temperature the curves run on.
+
+    source is one of:
+        "max"                  hottest sensor of any kind
+        "cpu_max"              hottest CPU
+        "cpu:0.7,exhaust:0.3"  weighted average of the hottest sensor of each kind
+        "0Eh"                  a specific sensor ID (the original behaviour, first CPU)
+    """
+    available = [reading for reading in readings if reading.value is not None]
+    if source == "max":
+        candidates = available
+    elif source == "cpu_max":
+        candidates = [reading for reading in available if reading.kind == "cpu"]
+    elif ":" in source:
+        weights = {kind.strip(): float(weight) for kind, weight in (part.split(":") for part in source.split(","))}
+        hottest = {kind: max((r.value for r in available if r.kind == kind), default=None) for kind in weights}
+        present = {kind: value for kind, value in hottest.items() if value is not None}
+        if not present:
+            raise ValueError(f"No readings for any of {', '.join(weights)}")
+        return sum(value * weights[kind] for kind, value in present.items()) / sum(weights[kind] for kind in present)
+    else:
+        candidates = [reading for reading in available if reading.sensor_id == source]
+    if not candidates:
+        raise ValueError(f"No temperature reading matches {source!r}")
+    return max(reading.value for reading in candidates)
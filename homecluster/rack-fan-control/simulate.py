@@ -0,0 +1,331 @@
+"""
+Replay recorded temperature traces through the fan controller, offline.
+
+ipmitool is replaced by a stand-in shell (this script run with --ipmitool) that serves
+temperatures from a simple thermal model, and Home Assistant and Prometheus by local
+HTTP servers.
+Everything between them - IPMISession, IDRACControl, RackFan, the curves and the
+asyncio controller - is the real code, so a curve or controller change can be measured
+before it goes near the rack.
+
+The trace is a CSV of "seconds,temperature[,cpu_utilisation]" recorded at some reference
+fan speed. The model pulls the CPU towards the trace temperature, minus `--cooling`
+degrees for every percent of fan speed above `--reference-fan`, with a first order lag
+of `--tau` seconds. The utilisation column, if present, is what the stand-in Prometheus
+reports for configs that use the feed-forward.
+
+Usage:
+    python simulate.py traces/load-spike.csv
+    python simulate.py traces/load-spike.csv --speedup 120 --configs my-configs.json
+
+A configs file maps a name to options: mode ("curve" or "pid"), interpolate, hysteresis,
+min_change, adaptive, feedforward (the gain in degrees at 100% utilisation), and for
+pid mode setpoint, kp, ki, kd and max_rate.
+"""
+import argparse
+import asyncio
+import bisect
+import csv
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from controller import FanController
+from feedforward import LoadFeedForward
+from hass import HomeAssistantREST
+from scheduler import AdaptiveInterval
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CONFIGS = {
+    "steps": {},
+    "interpolated": {"interpolate": True},
+    "hysteresis": {"interpolate": True, "hysteresis": 3, "min_change": 5},
+    "adaptive": {"interpolate": True, "hysteresis": 3, "min_change": 5, "adaptive": True},
+    "pid": {"mode": "pid", "min_change": 5},
+    "feedforward": {"interpolate": True, "hysteresis": 3, "min_change": 5, "feedforward": 10},
+}
+
+SENSOR_LINES = """Inlet Temp       | 04h | ok  |  7.1 | {inlet:.0f} degrees C
+Exhaust Temp     | 01h | ok  |  7.1 | {exhaust:.0f} degrees C
+Temp             | 0Eh | ok  |  3.1 | {cpu:.0f} degrees C
+Temp             | 0Fh | ok  |  3.2 | {cpu2:.0f} degrees C
+"""
+
+
+def fake_ipmitool():
+    """
+    Minimal `ipmitool shell`: serves the temperature in $SIM_STATE and logs fan writes to $SIM_WRITES.
+
+    Input is echoed behind the prompt, as ipmitool's readline shell can do, so the
+    client has to tell its sentinel apart from the `echo` command that prints it.
+    """
+    state_path, writes_path = os.environ["SIM_STATE"], os.environ["SIM_WRITES"]
+    for line in sys.stdin:
+        command = line.strip()
+        print(f"ipmitool> {command}")
+        if command in ("quit", "exit"):
+            break
+        if command.startswith("echo "):
+            print(command[len("echo "):])
+        elif command == "sdr type temperature":
+            with open(state_path) as f:
+                cpu = float(f.read())
+            print(SENSOR_LINES.format(inlet=22, exhaust=cpu * 0.6, cpu=cpu, cpu2=cpu - 4), end="")
+        elif command.startswith("sdr dump "):
+            open(command.split()[2], "wb").close()
+        elif command.startswith("raw 0x30 0x30 0x02"):
+            with open(writes_path, "a") as f:
+                f.write(command + "\n")
+        sys.stdout.flush()
+
+
+class FakeHomeAssistant(BaseHTTPRequestHandler):
+    """Just enough of the REST API for RackFan: set_percentage and reading the state back."""
+
+    protocol_version = "HTTP/1.1"
+    percentage = 0
+    writes = 0
+
+    def _reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).percentage = body["percentage"]
+        type(self).writes += 1
+        self._reply([])
+
+    def do_GET(self):
+        self._reply({"entity_id": self.path.rsplit("/", 1)[-1], "state": "on", "attributes": {"percentage": type(self).percentage}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePrometheus(BaseHTTPRequestHandler):
+    """Instant queries only, every one answered with the trace's current utilisation for `instance`."""
+
+    protocol_version = "HTTP/1.1"
+    instance = None
+    utilisation = 0.0
+
+    def do_GET(self):
+        result = [{"metric": {"instance": type(self).instance}, "value": [time.time(), str(type(self).utilisation)]}]
+        data = json.dumps({"status": "success", "data": {"resultType": "vector", "result": result}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_trace(path):
+    with open(path) as f:
+        rows = [[float(value) for value in row] for row in csv.reader(f) if row[0][:1].isdigit()]
+    times = [row[0] for row in rows]
+    temps = [row[1] for row in rows]
+    utilisation = [row[2] if len(row) > 2 else 0.0 for row in rows]
+    return times, temps, utilisation
+
+
+def trace_value(trace, t, column=1):
+    times, values = trace[0], trace[column]
+    i = bisect.bisect_right(times, t) - 1
+    if i < 0:
+        return values[0]
+    if i >= len(times) - 1:
+        return values[-1]
+    return values[i] + (values[i + 1] - values[i]) * (t - times[i]) / (times[i + 1] - times[i])
+
+
+def load_fan_control():
+    # fan-control.py isn't importable by name
+    spec = importlib.util.spec_from_file_location("fan_control", os.path.join(HERE, "fan-control.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class SimulatedInterval(AdaptiveInterval):
+    """AdaptiveInterval that reasons in simulated seconds but sleeps in accelerated real ones."""
+
+    def __init__(self, sim_clock, speedup, **kwargs):
+        super().__init__(**kwargs)
+        self.sim_clock = sim_clock
+        self.speedup = speedup
+
+    def next(self, temp, now=None):
+        return super().next(temp, self.sim_clock()) / self.speedup
+
+
+async def run_config(fc, name, options, trace, args, workdir):
+    state_path = os.path.join(workdir, f"{name}.temp")
+    writes_path = os.path.join(workdir, f"{name}.writes")
+    open(writes_path, "w").close()
+    os.environ.update(SIM_STATE=state_path, SIM_WRITES=writes_path)
+
+    FakeHomeAssistant.percentage = 0
+    FakeHomeAssistant.writes = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeHomeAssistant)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    prometheus = None
+    feedforward = None
+    if options.get("feedforward"):
+        FakePrometheus.instance = name
+        prometheus = ThreadingHTTPServer(("127.0.0.1", 0), FakePrometheus)
+        threading.Thread(target=prometheus.serve_forever, daemon=True).start()
+        # Prometheus' own timings are in real seconds, scale them like the poll interval
+        feedforward = LoadFeedForward(
+            f"http://127.0.0.1:{prometheus.server_port}",
+            instances={name: name},
+            gain=options["feedforward"],
+            refresh_interval=15 / args.speedup,
+            max_age=60 / args.speedup,
+        )
+
+    def make_curve(points):
+        # Options not given fall back to fan-control's own defaults
+        return fc.make_curve(points, {"mode": "curve", "interpolate": False, "hysteresis": 0, "min_change": 0, **options}, clock=lambda: sim_time)
+
+    scheduler = None
+    if options.get("adaptive"):
+        scheduler = SimulatedInterval(sim_clock=lambda: sim_time, speedup=args.speedup, warning_temp=fc.CPU_WARNING_TEMP)
+
+    idrac = fc.IDRACControl(HOST="simulated", USER="root", PASSWORD="", NAME=name)
+    idrac.cache_sdr()
+    rack_fan = fc.RackFan(HomeAssistantREST(f"http://127.0.0.1:{server.server_port}", "token"))
+    controller = FanController(
+        [idrac],
+        [rack_fan],
+        make_server_curve=lambda: make_curve(fc.SERVER_FAN_CURVE),
+        rack_curve=make_curve(fc.RACK_FAN_CURVE),
+        interval=args.interval / args.speedup,
+        scheduler=scheduler,
+        feedforward=feedforward,
+    )
+
+    latencies = []
+    original_step = controller.step
+
+    async def timed_step():
+        start = time.monotonic()
+        await original_step()
+        latencies.append(time.monotonic() - start)
+
+    controller.step = timed_step
+
+    sim_time = 0.0
+    cpu = trace_value(trace, 0)
+    above_warning = 0.0
+    fan_seconds = 0.0
+    peak = cpu
+    tick = 0.01
+
+    def write_state():
+        with open(state_path + ".tmp", "w") as f:
+            f.write(str(cpu))
+        os.replace(state_path + ".tmp", state_path)
+
+    write_state()
+    task = asyncio.create_task(controller.run())
+    last = time.monotonic()
+    try:
+        while sim_time < trace[0][-1]:
+            await asyncio.sleep(tick)
+            # Advance by the real time that passed, sleeps always overrun a little
+            now = time.monotonic()
+            dt = (now - last) * args.speedup
+            last = now
+            sim_time += dt
+            fan = max(idrac.FAN_SPEED.values(), default=args.reference_fan)
+            fan_seconds += fan * dt
+            FakePrometheus.utilisation = trace_value(trace, sim_time, column=2)
+            target = trace_value(trace, sim_time) - args.cooling * (fan - args.reference_fan)
+            cpu += (target - cpu) * min(1.0, dt / args.tau)
+            if cpu > fc.CPU_WARNING_TEMP:
+                above_warning += dt
+            peak = max(peak, cpu)
+            write_state()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        idrac.session.close()
+        server.shutdown()
+        if prometheus is not None:
+            prometheus.shutdown()
+
+    with open(writes_path) as f:
+        ipmi_writes = sum(1 for _ in f)
+    latencies.sort()
+    return {
+        "config": name,
+        "polls": len(latencies),
+        "loop_p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "loop_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        "ipmi_writes": ipmi_writes,
+        "hass_writes": FakeHomeAssistant.writes,
+        "above_warning_s": above_warning,
+        "peak_c": peak,
+        "overshoot_c": max(0.0, peak - fc.CPU_WARNING_TEMP),
+        "avg_fan_pct": fan_seconds / sim_time,
+    }
+
+
+def print_report(results):
+    columns = ["config", "polls", "loop_p50_ms", "loop_p95_ms", "ipmi_writes", "hass_writes", "above_warning_s", "peak_c", "overshoot_c", "avg_fan_pct"]
+    print(" | ".join(f"{column:>15}" for column in columns))
+    for result in results:
+        print(" | ".join(f"{result[column]:>15.1f}" if isinstance(result[column], float) else f"{result[column]:>15}" for column in columns))
+
+
+async def main(args):
+    fc = load_fan_control()
+    trace = load_trace(args.trace)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    # Put the stand-in first on PATH so IPMISession launches it instead of the real ipmitool
+    workdir = tempfile.mkdtemp(prefix="fan-control-sim-")
+    shim = os.path.join(workdir, "ipmitool")
+    with open(shim, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" --ipmitool "$@"\n')
+    os.chmod(shim, 0o755)
+    os.environ["PATH"] = workdir + os.pathsep + os.environ["PATH"]
+    os.environ["SDR_CACHE_DIR"] = workdir
+
+    results = []
+    for name, options in configs.items():
+        results.append(await run_config(fc, name, options, trace, args, workdir))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--ipmitool"]:
+        fake_ipmitool()
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Replay temperature traces through the fan controller")
+    parser.add_argument("trace", help="CSV of seconds,temperature[,cpu_utilisation]")
+    parser.add_argument("--configs", help="JSON file of named controller configurations")
+    parser.add_argument("--speedup", type=float, default=60, help="Simulated seconds per real second")
+    parser.add_argument("--interval", type=float, default=5, help="Poll interval in simulated seconds")
+    parser.add_argument("--reference-fan", type=float, default=30, help="Fan speed the trace was recorded at")
+    parser.add_argument("--cooling", type=float, default=0.25, help="Degrees C removed per fan percent above the reference")
+    parser.add_argument("--tau", type=float, default=30, help="Thermal time constant in seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The daemon's modules sit next to fan-control.py and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+from ipmi import IPMICommandError, IPMISession
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# `ipmitool shell` stand-in: echoes input behind the prompt and rejects writes to fan 0x07
+FAKE_SHELL = r"""
+import sys
+for line in sys.stdin:
+    command = line.strip()
+    print(f"ipmitool> {command}")
+    if command == "quit":
+        break
+    if command.startswith("echo "):
+        print(command[len("echo "):])
+    elif command.startswith("raw 0x30 0x30 0x02 0x07"):
+        print("Unable to send RAW command (channel=0x0 netfn=0x30 lun=0x0 cmd=0x30 rsp=0xc1): Invalid command")
+    elif command == "sdr type temperature":
+        print("Temp             | 0Eh | ok  |  3.1 | 55 degrees C")
+    sys.stdout.flush()
+"""
+
+
+def fake_session():
+    session = IPMISession("fake", "root", "", timeout=5)
+    session._command = lambda: [sys.executable, "-c", FAKE_SHELL]
+    return session
+
+
+def test_rejected_command_raises_and_keeps_the_session():
+    session = fake_session()
+    try:
+        with pytest.raises(IPMICommandError, match="Invalid command"):
+            session.run("raw 0x30 0x30 0x02 0x07 0x32")
+        proc = session.proc
+        assert "55 degrees C" in session.run("sdr type temperature")
+        assert session.proc is proc
+    finally:
+        session.close()
+
+
+def test_rejected_fan_write_is_not_recorded():
+    spec = importlib.util.spec_from_file_location("fan_control", os.path.join(HERE, "fan-control.py"))
+    fan_control = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fan_control)
+
+    idrac = fan_control.IDRACControl(HOST="fake", USER="root", PASSWORD="", ZONES={"rear": {"source": "0Eh", "fans": [0x07]}})
+    idrac.session.close()
+    idrac.session = fake_session()
+    try:
+        with pytest.raises(IPMICommandError):
+            idrac.update_fan_speed_percentage(50, zone="rear")
+        assert "rear" not in idrac.FAN_SPEED
+    finally:
+        idrac.session.close()
@@ -30,11 +30,12 @@ import pulumi
 import pulumi_kubernetes as k8s
 
 # Import infrastructure components
-from infrastructure.iso import talos_iso
+from infrastructure.iso import download_talos_iso
 from infrastructure.vms import create_all_vms
+from infrastructure.addresses import node_ip
 
 # Import Talos components
-from talos.secrets import machine_secrets
+from talos.secrets import get_machine_secrets
 from talos.bootstrap import bootstrap_cluster, get_kubeconfig, get_talosconfig
 
 # Import configuration
@@ -56,7 +57,7 @@ def main() -> None:
     kubeconfig = get_kubeconfig(bootstrap, control_plane_vms[0])
 
     # Export outputs
-    pulumi.export("talos_iso_id", talos_iso.id)
+    pulumi.export("talos_iso_id", download_talos_iso())
 
     pulumi.export("control_plane_vm_ids", [vm.vm_id for vm in control_plane_vms])
     pulumi.export("worker_vm_ids", [vm.vm_id for vm in worker_vms])
@@ -65,24 +66,15 @@ def main() -> None:
     pulumi.export("worker_names", [node.name for node in WORKER_NODES])
 
     # Export VM IPs (useful for debugging)
-    pulumi.export("control_plane_ips", [
-        vm.ipv4_addresses.apply(
-            lambda addrs: addrs[1][0] if addrs and len(addrs) > 1 and addrs[1] else addrs[0][0] if addrs and addrs[0] else "pending"
-        )
-        for vm in control_plane_vms
-    ])
-    pulumi.export("worker_ips", [
-        vm.ipv4_addresses.apply(
-            lambda addrs: addrs[1][0] if addrs and len(addrs) > 1 and addrs[1] else addrs[0][0] if addrs and addrs[0] else "pending"
-        )
-        for vm in worker_vms
-    ])
+    pulumi.export("control_plane_ips", [node_ip(node, vm) for node, vm in zip(CONTROL_PLANE_NODES, control_plane_vms)])
+    pulumi.export("worker_ips", [node_ip(node, vm) for node, vm in zip(WORKER_NODES, worker_vms)])
 
     # Export kubeconfig and talosconfig
     pulumi.export("kubeconfig", kubeconfig.kubeconfig_raw)
     pulumi.export("talosconfig", get_talosconfig())
 
     # Export client configuration for talosctl
+    machine_secrets = get_machine_secrets()
     pulumi.export("talos_client_ca", machine_secrets.client_configuration.ca_certificate)
     pulumi.export("talos_client_cert", machine_secrets.client_configuration.client_certificate)
     pulumi.export("talos_client_key", machine_secrets.client_configuration.client_key)
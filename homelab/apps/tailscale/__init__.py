@@ -2,13 +2,14 @@ from pulumi import ResourceOptions
 from pulumi_kubernetes.helm.v3 import Chart, ChartOpts, FetchOpts
 from pulumi_kubernetes.core.v1 import Namespace
 
-from config.settings import tailscale_operator_settings
+from config.settings import get_tailscale_operator_settings
 
 CLUSTER_NAME = "Homelab"
 
 
 def deploy_tailscale(k8s_provider):
     """Deploy Tailscale operator to the cluster."""
+    tailscale_operator_settings = get_tailscale_operator_settings()
     opts = ResourceOptions(provider=k8s_provider)
 
     namespace = Namespace(
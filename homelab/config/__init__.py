@@ -1,10 +1,17 @@
-from .settings import proxmox_settings, cluster_settings
-from .nodes import NodeSpec, CONTROL_PLANE_NODES, WORKER_NODES, ALL_NODES
+from .settings import get_proxmox_settings, get_cluster_settings, get_tailscale_settings, get_tailscale_operator_settings
+from .profiles import PerformanceProfile, PROFILES
+from .nodes import NodeSpec, NodePool, NODE_POOLS, CONTROL_PLANE_NODES, WORKER_NODES, ALL_NODES
 
 __all__ = [
-    "proxmox_settings",
-    "cluster_settings",
+    "get_proxmox_settings",
+    "get_cluster_settings",
+    "get_tailscale_settings",
+    "get_tailscale_operator_settings",
+    "PerformanceProfile",
+    "PROFILES",
     "NodeSpec",
+    "NodePool",
+    "NODE_POOLS",
     "CONTROL_PLANE_NODES",
     "WORKER_NODES",
     "ALL_NODES",
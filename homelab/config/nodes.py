@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from typing import Literal
 
+from config.profiles import PerformanceProfile, DEFAULT_PROFILE, CONTROL_PLANE_PROFILE, WORKER_PROFILE, DATABASE_PROFILE
+
 
 @dataclass
 class NodeSpec:
@@ -12,20 +14,81 @@ class NodeSpec:
     memory_mb: int
     disk_gb: int
     role: Literal["controlplane", "worker"]
+    profile: PerformanceProfile = DEFAULT_PROFILE
+    # Kernel/sysctl/kubelet tuning profile, see TUNING_PROFILES in talos/config.py
+    tuning: str = "default"
+
+
+@dataclass
+class NodePool:
+    """
+    A group of identically sized nodes, expanded into NodeSpecs.
+
+    Nodes are named `{name_prefix}-{index}` and take VM IDs from the start of
+    `vm_ids` in order, so growing `count` only adds nodes at the end.
+    """
+
+    name_prefix: str
+    count: int
+    cpu_cores: int
+    memory_mb: int
+    disk_gb: int
+    role: Literal["controlplane", "worker"]
+    vm_ids: range
+    profile: PerformanceProfile = DEFAULT_PROFILE
+    tuning: str = "default"
+
+    def nodes(self) -> list[NodeSpec]:
+        """Expand the pool into one NodeSpec per node."""
+        if self.count > len(self.vm_ids):
+            raise ValueError(f"Node pool {self.name_prefix} has {self.count} nodes but only {len(self.vm_ids)} VM IDs ({self.vm_ids.start}-{self.vm_ids.stop - 1})")
+        return [
+            NodeSpec(
+                name=f"{self.name_prefix}-{i}",
+                vm_id=self.vm_ids[i],
+                cpu_cores=self.cpu_cores,
+                memory_mb=self.memory_mb,
+                disk_gb=self.disk_gb,
+                role=self.role,
+                profile=self.profile,
+                tuning=self.tuning,
+            )
+            for i in range(self.count)
+        ]
+
+
+def expand_pools(pools: list[NodePool]) -> list[NodeSpec]:
+    """Expand node pools into NodeSpecs, rejecting pools whose VM ID ranges overlap."""
+    for i, pool in enumerate(pools):
+        for other in pools[i + 1:]:
+            if pool.vm_ids.start < other.vm_ids.stop and other.vm_ids.start < pool.vm_ids.stop:
+                raise ValueError(f"Node pools {pool.name_prefix} and {other.name_prefix} have overlapping VM ID ranges")
+    return [node for pool in pools for node in pool.nodes()]
 
 
 # Control Plane Nodes: 4 CPU, 8GB RAM, 50GB disk
-CONTROL_PLANE_NODES: list[NodeSpec] = [
-    NodeSpec(name="k8s-control-0", vm_id=200, cpu_cores=4, memory_mb=8192, disk_gb=50, role="controlplane"),
-    NodeSpec(name="k8s-control-1", vm_id=201, cpu_cores=4, memory_mb=8192, disk_gb=50, role="controlplane"),
-    NodeSpec(name="k8s-control-2", vm_id=202, cpu_cores=4, memory_mb=8192, disk_gb=50, role="controlplane"),
-]
+CONTROL_PLANE_POOL = NodePool(
+    name_prefix="k8s-control",
+    count=3,
+    cpu_cores=4,
+    memory_mb=8192,
+    disk_gb=50,
+    role="controlplane",
+    vm_ids=range(200, 210),
+    profile=CONTROL_PLANE_PROFILE,
+    tuning="control-plane",
+)
 
 # Worker Nodes: 4 CPU, 16GB RAM, 100GB disk
-WORKER_NODES: list[NodeSpec] = [
-    NodeSpec(name="k8s-worker-0", vm_id=210, cpu_cores=4, memory_mb=16384, disk_gb=100, role="worker"),
-    NodeSpec(name="k8s-worker-1", vm_id=211, cpu_cores=4, memory_mb=16384, disk_gb=100, role="worker"),
-    NodeSpec(name="k8s-worker-2", vm_id=212, cpu_cores=4, memory_mb=16384, disk_gb=100, role="worker"),
-]
+WORKER_POOL = NodePool(name_prefix="k8s-worker", count=3, cpu_cores=4, memory_mb=16384, disk_gb=100, role="worker", vm_ids=range(210, 300), profile=WORKER_PROFILE, tuning="nfs-worker")
+
+# Database Nodes: 4 CPU, 16GB RAM (8GB of it reserved as 2MB hugepages), 100GB disk.
+# Ordinary workers otherwise, only pods requesting hugepages-2Mi can use the reserved pages.
+# None by default, raise `count` to add them
+DATABASE_POOL = NodePool(name_prefix="k8s-database", count=0, cpu_cores=4, memory_mb=16384, disk_gb=100, role="worker", vm_ids=range(300, 320), profile=DATABASE_PROFILE, tuning="database")
+
+NODE_POOLS: list[NodePool] = [CONTROL_PLANE_POOL, WORKER_POOL, DATABASE_POOL]
 
-ALL_NODES = CONTROL_PLANE_NODES + WORKER_NODES
+ALL_NODES: list[NodeSpec] = expand_pools(NODE_POOLS)
+CONTROL_PLANE_NODES: list[NodeSpec] = [node for node in ALL_NODES if node.role == "controlplane"]
+WORKER_NODES: list[NodeSpec] = [node for node in ALL_NODES if node.role == "worker"]
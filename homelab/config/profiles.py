@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from typing import Literal
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """
+    VM-level tuning applied by create_talos_vm.
+
+    Hugepages need NUMA enabled, and both they and `cpu_affinity` need the provider
+    to authenticate as root@pam.
+    """
+
+    name: str
+    # Expose the host's NUMA topology to the guest
+    numa: bool = False
+    # Host CPUs the vCPUs are pinned to, e.g. "0-3", empty leaves scheduling to the host
+    cpu_affinity: str = ""
+    # Relative CPU weight against other VMs on the host, None keeps the Proxmox default
+    # (100 on cgroup v2 hosts, i.e. PVE 7 and later; 1024 on cgroup v1)
+    cpu_units: int | None = None
+    # Back guest memory with hugepages: "2" (2MB), "1024" (1GB) or "any", empty for normal pages
+    hugepages: Literal["", "2", "1024", "any"] = ""
+    disk_cache: Literal["none", "directsync", "writethrough", "writeback", "unsafe"] = "none"
+    disk_aio: Literal["io_uring", "native", "threads"] = "io_uring"
+    # One virtio-net queue per vCPU instead of a single queue
+    net_multiqueue: bool = False
+
+    def net_queues(self, cpu_cores: int) -> int | None:
+        """Queues for the VM's NIC, None keeps the Proxmox default."""
+        return min(cpu_cores, 64) if self.net_multiqueue else None
+
+
+# No tuning, every setting left at the Proxmox default
+DEFAULT_PROFILE = PerformanceProfile(name="default")
+
+# Control planes: etcd is fsync-bound, so no host page cache between it and the disk
+# (native AIO with cache=none), and twice the default cgroup v2 CPU weight so apiserver/etcd aren't starved
+CONTROL_PLANE_PROFILE = PerformanceProfile(
+    name="etcd-low-latency",
+    numa=True,
+    cpu_units=200,
+    disk_cache="none",
+    disk_aio="native",
+    net_multiqueue=True,
+)
+
+# Workers: image pulls and app I/O benefit from the host page cache and io_uring
+WORKER_PROFILE = PerformanceProfile(
+    name="throughput",
+    numa=True,
+    disk_cache="writeback",
+    disk_aio="io_uring",
+    net_multiqueue=True,
+)
+
+# Database nodes: guest memory on 2MB host hugepages, so Postgres' buffer pool, itself on
+# hugepages inside the guest, isn't translated through 4K pages twice. The host needs
+# enough 2MB pages reserved (vm.nr_hugepages on the Proxmox node) for the whole VM
+DATABASE_PROFILE = PerformanceProfile(
+    name="database",
+    numa=True,
+    cpu_units=200,
+    hugepages="2",
+    disk_cache="none",
+    disk_aio="native",
+    net_multiqueue=True,
+)
+
+PROFILES: dict[str, PerformanceProfile] = {
+    profile.name: profile for profile in (DEFAULT_PROFILE, CONTROL_PLANE_PROFILE, WORKER_PROFILE, DATABASE_PROFILE)
+}
@@ -1,3 +1,7 @@
+import functools
+from typing import Literal
+
+from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 from pydantic import Field
 import pulumi
@@ -11,9 +15,11 @@ class ProxmoxSettings(BaseSettings):
     password: str = Field(alias="PROXMOX_VE_PASSWORD")
     insecure: bool = Field(default=True, alias="PROXMOX_VE_INSECURE")
     node_name: str = Field(default="proxmox")
+    # Hosts to spread node VMs over, empty puts everything on node_name
+    hosts: list[str] = Field(default_factory=list, alias="PROXMOX_HOSTS")
+    cpu_overcommit: float = Field(default=4.0, alias="PROXMOX_CPU_OVERCOMMIT")
 
     class Config:
-        env_file = ".env"
         extra = "ignore"
 
 
@@ -22,12 +28,38 @@ class ClusterSettings(BaseSettings):
 
     name: str = Field(default="homelab")
     talos_version: str = Field(default="v1.9.0")
+    # Empty keeps the Kubernetes version the Talos release defaults to
+    kubernetes_version: str = Field(default="")
+    # Workers upgraded at the same time, and the time each node gets to upgrade and come back
+    worker_upgrade_batch: int = Field(default=2)
+    upgrade_timeout: int = Field(default=900)
     storage_pool: str = Field(default="local-lvm")
     network_bridge: str = Field(default="vmbr0")
     vip_hostname: str = Field(default="", alias="CLUSTER_VIP_HOSTNAME")
+    # When worker nodes get their configuration, relative to the control plane:
+    # parallel - straight away, they join by themselves once the cluster is bootstrapped
+    # after-bootstrap - once etcd has been bootstrapped on the first control plane
+    # after-control-plane - once every control plane has been configured
+    worker_apply: Literal["parallel", "after-bootstrap", "after-control-plane"] = Field(default="parallel")
+    # Which guest agent interface holds the node IP, by name or by CIDR. Empty picks the VM's own NIC
+    node_interface: str = Field(default="")
+    node_cidr: str = Field(default="")
+    # VMs created against the Proxmox API at the same time
+    vm_create_concurrency: int = Field(default=3)
+    # How node VMs get Talos: "iso" boots the installer ISO and installs to disk,
+    # "clone" clones a template built from the Talos disk image (linked unless clone_full)
+    provisioning: Literal["iso", "clone"] = Field(default="iso")
+    clone_full: bool = Field(default=False)
+    # Talos image cache: datastore with the iso content type (shared storage serves every host),
+    # a version to download ahead of an upgrade, and optional sha256 per "version/kind"
+    image_datastore: str = Field(default="local")
+    prefetch_talos_version: str = Field(default="")
+    image_checksums: dict[str, str] = Field(default_factory=dict)
+    # Dedicated etcd disk for control planes, 0 keeps etcd on the OS disk. Empty datastore uses storage_pool
+    etcd_disk_gb: int = Field(default=0)
+    etcd_datastore: str = Field(default="")
 
     class Config:
-        env_file = ".env"
         env_prefix = "CLUSTER_"
         extra = "ignore"
 
@@ -38,7 +70,6 @@ class TailscaleSettings(BaseSettings):
     authkey: str = Field(alias="TAILSCALE_AUTHKEY")
 
     class Config:
-        env_file = ".env"
         extra = "ignore"
 
 
@@ -49,22 +80,70 @@ class TailscaleOperatorSettings(BaseSettings):
     client_secret: str = Field(alias="TAILSCALE_OPERATOR_CLIENT_SECRET")
 
     class Config:
-        env_file = ".env"
         extra = "ignore"
 
 
-# Load Pulumi config to override defaults
-config = pulumi.Config("homelab-talos")
-
-# Initialize settings instances
-proxmox_settings = ProxmoxSettings()
-proxmox_settings.node_name = config.get("proxmox_node") or proxmox_settings.node_name
-
-cluster_settings = ClusterSettings()
-cluster_settings.name = config.get("cluster_name") or cluster_settings.name
-cluster_settings.talos_version = config.get("talos_version") or cluster_settings.talos_version
-cluster_settings.storage_pool = config.get("storage_pool") or cluster_settings.storage_pool
-cluster_settings.network_bridge = config.get("network_bridge") or cluster_settings.network_bridge
-
-tailscale_settings = TailscaleSettings()
-tailscale_operator_settings = TailscaleOperatorSettings()
+@functools.cache
+def _load_env() -> None:
+    """Read .env into the environment once, variables already set win."""
+    load_dotenv(".env", override=False)
+
+
+@functools.cache
+def _pulumi_config() -> pulumi.Config:
+    """Pulumi config that overrides the defaults."""
+    return pulumi.Config("homelab-talos")
+
+
+@functools.cache
+def get_proxmox_settings() -> ProxmoxSettings:
+    """Proxmox settings, loaded on first use."""
+    _load_env()
+    config = _pulumi_config()
+    proxmox_settings = ProxmoxSettings()
+    proxmox_settings.node_name = config.get("proxmox_node") or proxmox_settings.node_name
+    proxmox_settings.hosts = config.get_object("proxmox_hosts") or proxmox_settings.hosts
+    proxmox_settings.cpu_overcommit = config.get_float("proxmox_cpu_overcommit") or proxmox_settings.cpu_overcommit
+    return proxmox_settings
+
+
+@functools.cache
+def get_cluster_settings() -> ClusterSettings:
+    """Cluster settings, loaded on first use."""
+    _load_env()
+    config = _pulumi_config()
+    cluster_settings = ClusterSettings()
+    cluster_settings.name = config.get("cluster_name") or cluster_settings.name
+    cluster_settings.talos_version = config.get("talos_version") or cluster_settings.talos_version
+    cluster_settings.kubernetes_version = config.get("kubernetes_version") or cluster_settings.kubernetes_version
+    cluster_settings.worker_upgrade_batch = config.get_int("worker_upgrade_batch") or cluster_settings.worker_upgrade_batch
+    cluster_settings.upgrade_timeout = config.get_int("upgrade_timeout") or cluster_settings.upgrade_timeout
+    cluster_settings.storage_pool = config.get("storage_pool") or cluster_settings.storage_pool
+    cluster_settings.network_bridge = config.get("network_bridge") or cluster_settings.network_bridge
+    cluster_settings.worker_apply = config.get("worker_apply") or cluster_settings.worker_apply
+    cluster_settings.node_interface = config.get("node_interface") or cluster_settings.node_interface
+    cluster_settings.node_cidr = config.get("node_cidr") or cluster_settings.node_cidr
+    cluster_settings.vm_create_concurrency = config.get_int("vm_create_concurrency") or cluster_settings.vm_create_concurrency
+    cluster_settings.provisioning = config.get("provisioning") or cluster_settings.provisioning
+    cluster_settings.etcd_disk_gb = config.get_int("etcd_disk_gb") or cluster_settings.etcd_disk_gb
+    cluster_settings.etcd_datastore = config.get("etcd_datastore") or cluster_settings.etcd_datastore
+    cluster_settings.image_datastore = config.get("image_datastore") or cluster_settings.image_datastore
+    cluster_settings.prefetch_talos_version = config.get("prefetch_talos_version") or cluster_settings.prefetch_talos_version
+    cluster_settings.image_checksums = config.get_object("image_checksums") or cluster_settings.image_checksums
+    if config.get_bool("clone_full") is not None:
+        cluster_settings.clone_full = config.get_bool("clone_full")
+    return cluster_settings
+
+
+@functools.cache
+def get_tailscale_settings() -> TailscaleSettings:
+    """Tailscale settings, loaded on first use."""
+    _load_env()
+    return TailscaleSettings()
+
+
+@functools.cache
+def get_tailscale_operator_settings() -> TailscaleOperatorSettings:
+    """Tailscale operator settings, loaded on first use."""
+    _load_env()
+    return TailscaleOperatorSettings()
@@ -1,10 +1,22 @@
-from .provider import proxmox_provider
-from .iso import talos_iso
-from .vms import create_talos_vm, create_all_vms
+from .provider import get_proxmox_provider
+from .iso import get_talos_image_cache, download_talos_iso, download_talos_disk_image, TalosImage, TalosImageCache
+from .vms import create_talos_template, create_talos_vm, create_all_vms
+from .addresses import NodeAddress, node_ip
+from .placement import HostCapacity, place_nodes, plan_placements
 
 __all__ = [
-    "proxmox_provider",
-    "talos_iso",
+    "get_proxmox_provider",
+    "get_talos_image_cache",
+    "download_talos_iso",
+    "download_talos_disk_image",
+    "TalosImage",
+    "TalosImageCache",
+    "create_talos_template",
     "create_talos_vm",
     "create_all_vms",
+    "NodeAddress",
+    "node_ip",
+    "HostCapacity",
+    "place_nodes",
+    "plan_placements",
 ]
@@ -0,0 +1,162 @@
+import ipaddress
+import json
+import ssl
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Any
+
+import pulumi
+import pulumi.dynamic
+import pulumi_proxmoxve as proxmoxve
+from config.settings import get_proxmox_settings, get_cluster_settings
+from config.nodes import NodeSpec
+
+
+class NodeAddressProvider(pulumi.dynamic.ResourceProvider):
+    """
+    Resolves a VM's IPv4 address from the QEMU guest agent through the Proxmox API.
+
+    The agent only answers once Talos has booted, so the lookup retries with
+    exponential backoff until `timeout` instead of settling for an empty address.
+    The result is kept in the stack state and only looked up again when the VM is
+    replaced (its MAC addresses change) or the interface selection changes.
+    """
+
+    # Changing any of these means a different VM or a different interface
+    REPLACE_ON = ("node_name", "vm_id", "mac_addresses", "interface", "cidr")
+
+    def _api(self, props: dict[str, Any]):
+        context = ssl.create_default_context()
+        if props["insecure"]:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        base = props["endpoint"].rstrip("/") + "/api2/json"
+        login = urllib.parse.urlencode({"username": props["username"], "password": props["password"]}).encode()
+        with urllib.request.urlopen(f"{base}/access/ticket", data=login, context=context, timeout=30) as response:
+            ticket = json.load(response)["data"]["ticket"]
+
+        def get(path: str) -> Any:
+            request = urllib.request.Request(f"{base}{path}", headers={"Cookie": f"PVEAuthCookie={ticket}"})
+            with urllib.request.urlopen(request, context=context, timeout=30) as response:
+                return json.load(response)["data"]
+
+        return get
+
+    @staticmethod
+    def _pick(interfaces: list[dict[str, Any]], props: dict[str, Any]) -> str | None:
+        """Pick the address by interface name, CIDR, or the VM's own NIC, skipping loopback and link-local."""
+        macs = {mac.lower() for mac in props.get("mac_addresses") or []}
+        network = ipaddress.ip_network(props["cidr"]) if props.get("cidr") else None
+        for interface in interfaces:
+            if props.get("interface") and interface.get("name") != props["interface"]:
+                continue
+            if not props.get("interface") and not network and macs and interface.get("hardware-address", "").lower() not in macs:
+                continue
+            for address in interface.get("ip-addresses", []):
+                if address.get("ip-address-type") != "ipv4":
+                    continue
+                ip = ipaddress.ip_address(address["ip-address"])
+                if ip.is_loopback or ip.is_link_local:
+                    continue
+                if network is not None and ip not in network:
+                    continue
+                return str(ip)
+        return None
+
+    def _resolve(self, props: dict[str, Any]) -> str:
+        get = self._api(props)
+        path = f"/nodes/{props['node_name']}/qemu/{int(props['vm_id'])}/agent/network-get-interfaces"
+        deadline = time.monotonic() + props["timeout"]
+        delay = 2.0
+        last_error = "no matching address"
+        while True:
+            try:
+                address = self._pick(get(path)["result"], props)
+                if address:
+                    return address
+            except (urllib.error.URLError, TimeoutError) as e:
+                # HTTP 500 while the guest agent isn't running yet
+                last_error = str(e)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Exception(f"VM {props['vm_id']} did not report an address within {props['timeout']}s ({last_error})")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 30.0)
+
+    def create(self, props: dict[str, Any]) -> pulumi.dynamic.CreateResult:
+        return pulumi.dynamic.CreateResult(f"{props['node_name']}/{int(props['vm_id'])}", {**props, "address": self._resolve(props)})
+
+    def diff(self, _id: str, olds: dict[str, Any], news: dict[str, Any]) -> pulumi.dynamic.DiffResult:
+        replaces = [key for key in self.REPLACE_ON if olds.get(key) != news.get(key)]
+        return pulumi.dynamic.DiffResult(changes=bool(replaces), replaces=replaces, delete_before_replace=True)
+
+    def read(self, id_: str, props: dict[str, Any]) -> pulumi.dynamic.ReadResult:
+        # `pulumi refresh` re-resolves, e.g. after a DHCP lease changed
+        return pulumi.dynamic.ReadResult(id_, {**props, "address": self._resolve(props)})
+
+
+class NodeAddress(pulumi.dynamic.Resource):
+    """IPv4 address of a Talos VM, as reported by its guest agent and cached in the stack state."""
+
+    address: pulumi.Output[str]
+
+    def __init__(
+        self,
+        name: str,
+        vm: proxmoxve.vm.VirtualMachine,
+        interface: str = "",
+        cidr: str = "",
+        timeout: int = 600,
+        opts: pulumi.ResourceOptions | None = None,
+    ):
+        proxmox_settings = get_proxmox_settings()
+        super().__init__(
+            NodeAddressProvider(),
+            name,
+            {
+                "endpoint": proxmox_settings.endpoint,
+                "username": proxmox_settings.username,
+                "password": pulumi.Output.secret(proxmox_settings.password),
+                "insecure": proxmox_settings.insecure,
+                "node_name": vm.node_name,
+                "vm_id": vm.vm_id,
+                # The NICs' configured MACs: stable, and new ones mean the VM was replaced
+                "mac_addresses": vm.network_devices.apply(lambda devices: [device.mac_address for device in devices or [] if device.mac_address]),
+                "interface": interface,
+                "cidr": cidr,
+                "timeout": timeout,
+                "address": None,
+            },
+            pulumi.ResourceOptions.merge(pulumi.ResourceOptions(depends_on=[vm], additional_secret_outputs=["password"]), opts),
+        )
+
+
+_node_addresses: dict[str, NodeAddress] = {}
+
+
+def node_ip(node: NodeSpec, vm: proxmoxve.vm.VirtualMachine) -> pulumi.Output[str]:
+    """
+    Get the IP address of a node's VM, resolving it once per stack.
+
+    The interface is chosen by `cluster_settings.node_interface` (e.g. "eth0") or
+    `cluster_settings.node_cidr` (e.g. "192.168.0.0/24"), and otherwise is the one
+    whose MAC matches the VM's network device, which skips lo and tailscale0.
+
+    Args:
+        node: Node specification
+        vm: The Proxmox VM resource for the node
+
+    Returns:
+        The node's IPv4 address
+    """
+    cluster_settings = get_cluster_settings()
+    if node.name not in _node_addresses:
+        _node_addresses[node.name] = NodeAddress(
+            f"address-{node.name}",
+            vm=vm,
+            interface=cluster_settings.node_interface,
+            cidr=cluster_settings.node_cidr,
+        )
+    return _node_addresses[node.name].address
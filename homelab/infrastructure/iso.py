@@ -1,7 +1,11 @@
+import functools
+from dataclasses import dataclass
+from typing import Literal
+
 import pulumi
 import pulumi_proxmoxve as proxmoxve
-from config.settings import proxmox_settings, cluster_settings
-from infrastructure.provider import proxmox_provider
+from config.settings import get_proxmox_settings, get_cluster_settings
+from infrastructure.provider import get_proxmox_provider
 
 # Talos Image Factory schematic configuration
 # This schematic includes the following extensions:
@@ -41,6 +45,20 @@ def get_talos_iso_url(version: str, schematic_id: str = TALOS_SCHEMATIC_ID) -> s
     return f"https://factory.talos.dev/image/{schematic_id}/{version}/metal-amd64.iso"
 
 
+def get_talos_disk_image_url(version: str, schematic_id: str = TALOS_SCHEMATIC_ID) -> str:
+    """
+    Generate the Talos Image Factory URL for a raw disk image, used to build VM templates.
+
+    Args:
+        version: Talos version (e.g., "v1.9.0")
+        schematic_id: Image Factory schematic ID
+
+    Returns:
+        URL to download the zstd-compressed raw disk image
+    """
+    return f"https://factory.talos.dev/image/{schematic_id}/{version}/metal-amd64.raw.zst"
+
+
 def get_talos_installer_image(version: str, schematic_id: str = TALOS_SCHEMATIC_ID) -> str:
     """
     Get the Talos installer image reference for machine configuration.
@@ -55,32 +73,244 @@ def get_talos_installer_image(version: str, schematic_id: str = TALOS_SCHEMATIC_
     return f"factory.talos.dev/installer/{schematic_id}:{version}"
 
 
-def download_talos_iso() -> proxmoxve.download.File:
+@dataclass(frozen=True)
+class TalosImage:
     """
-    Download Talos Linux ISO to Proxmox storage.
+    One Image Factory artifact, identified by its content: schematic, version and kind.
 
-    Uses the Talos Image Factory to get an ISO with:
-    - QEMU guest agent extension (required for Proxmox VM management)
-    - Tailscale extension (for VPN networking)
+    The file name is derived from those (plus the checksum when one is pinned), so a
+    file of that name on a datastore is known to be this exact image and can be
+    reused instead of downloaded again.
     """
-    version = cluster_settings.talos_version
-    iso_url = get_talos_iso_url(version)
 
-    talos_iso = proxmoxve.download.File(
-        "talos-iso",
+    version: str
+    kind: Literal["iso", "disk"]
+    schematic_id: str = TALOS_SCHEMATIC_ID
+    checksum: str = ""
+
+    @property
+    def url(self) -> str:
+        if self.kind == "iso":
+            return get_talos_iso_url(self.version, self.schematic_id)
+        return get_talos_disk_image_url(self.version, self.schematic_id)
+
+    @property
+    def file_name(self) -> str:
+        key = f"{self.version}-{self.schematic_id[:12]}" + (f"-{self.checksum[:12]}" if self.checksum else "")
+        # Proxmox only takes .iso and .img for the iso content type
+        return f"talos-{key}-amd64.{'iso' if self.kind == 'iso' else 'img'}"
+
+
+# Token of the provider's get_file invoke, failed invokes are reported under it
+GET_FILE_TOKEN = "proxmoxve:index/getFile:getFile"
+
+# Resource name of the ISO download from before the image cache existed
+LEGACY_ISO_RESOURCE = "talos-iso"
+
+
+def is_file_not_found(error: Exception) -> bool:
+    """
+    Whether get_file failed only because the file isn't on the datastore.
+
+    The provider has no typed not-found result: a failed invoke is a plain Exception
+    "invoke of <token> failed: <reason>". Anything but a not-found reason from get_file
+    (bad credentials, an unreachable API, a missing datastore) is a real error.
+    """
+    message = str(error)
+    if not message.startswith(f"invoke of {GET_FILE_TOKEN} failed:"):
+        return False
+    return "not found" in message[len(f"invoke of {GET_FILE_TOKEN} failed:"):].lower()
+
+
+def find_file(datastore_id: str, node_name: str, file_name: str) -> str | None:
+    """
+    Look up a file in a datastore's iso content.
+
+    Args:
+        datastore_id: Datastore to look in
+        node_name: Proxmox node to ask
+        file_name: File name on the datastore
+
+    Returns:
+        Its file ID, or None if there's no such file
+    """
+    try:
+        return proxmoxve.get_file(
+            content_type="iso",
+            datastore_id=datastore_id,
+            file_name=file_name,
+            node_name=node_name,
+            opts=pulumi.InvokeOptions(provider=get_proxmox_provider()),
+        ).id
+    except Exception as e:
+        if is_file_not_found(e):
+            return None
+        raise
+
+
+class TalosImageCache:
+    """
+    Content-addressed cache of Talos images on a Proxmox datastore.
+
+    Images already on the datastore are used as they are, otherwise they're
+    downloaded from the Image Factory. Downloads are retained when no longer
+    referenced, so going back to a version, rebuilding the cluster or rolling an
+    upgrade forward never waits on the internet. With a shared datastore (NFS,
+    CephFS) one copy serves every Proxmox host.
+    """
+
+    def __init__(self, datastore_id: str, node_name: str, checksums: dict[str, str] | None = None):
+        """
+        Args:
+            datastore_id: Datastore with the iso content type, ideally shared
+            node_name: Proxmox node that runs the downloads unless another host asks
+            checksums: Optional sha256 per "version/kind", e.g. {"v1.9.0/iso": "..."}
+        """
+        self.datastore_id = datastore_id
+        self.node_name = node_name
+        self.checksums = checksums or {}
+        self.entries: dict[tuple[TalosImage, str], pulumi.Output[str]] = {}
+        self.shared: bool | None = None
+
+    def _is_shared(self) -> bool:
+        if self.shared is None:
+            datastores = proxmoxve.storage.get_datastores(
+                node_name=self.node_name,
+                filters={"id": self.datastore_id},
+                opts=pulumi.InvokeOptions(provider=get_proxmox_provider()),
+            ).datastores or []
+            self.shared = bool(datastores and datastores[0].shared)
+        return self.shared
+
+    def _existing(self, image: TalosImage, node_name: str) -> str | None:
+        return find_file(self.datastore_id, node_name, image.file_name)
+
+    def get(self, version: str, kind: Literal["iso", "disk"], node_name: str | None = None) -> pulumi.Output[str]:
+        """
+        Get the Proxmox file ID of a Talos image, downloading it only if it isn't cached.
+
+        Args:
+            version: Talos version (e.g., "v1.9.0")
+            kind: "iso" for the installer ISO, "disk" for the raw disk image
+            node_name: Proxmox host that needs the image, only matters without shared storage
+
+        Returns:
+            File ID such as local:iso/talos-v1.9.0-7d4c31cbd96d-amd64.iso
+        """
+        image = TalosImage(version=version, kind=kind, checksum=self.checksums.get(f"{version}/{kind}", ""))
+        if node_name is None or node_name == self.node_name or self._is_shared():
+            node_name = self.node_name
+        if (image, node_name) in self.entries:
+            return self.entries[image, node_name]
+
+        existing = self._existing(image, node_name)
+        if existing is not None:
+            self.entries[image, node_name] = pulumi.Output.from_input(existing)
+            return self.entries[image, node_name]
+
+        resource_name = f"talos-image-{image.file_name.removesuffix('.iso').removesuffix('.img')}"
+        download = proxmoxve.download.File(
+            resource_name if node_name == self.node_name else f"{resource_name}-{node_name}",
+            content_type="iso",
+            datastore_id=self.datastore_id,
+            node_name=node_name,
+            url=image.url,
+            file_name=image.file_name,
+            decompression_algorithm="zst" if kind == "disk" else None,
+            checksum=image.checksum or None,
+            checksum_algorithm="sha256" if image.checksum else None,
+            overwrite=False,
+            upload_timeout=600,
+            verify=True,
+            # Once cached the file is found on the next run and this resource goes away; keep the file
+            opts=pulumi.ResourceOptions(provider=get_proxmox_provider(), retain_on_delete=True),
+        )
+        self.entries[image, node_name] = download.id
+        return download.id
+
+    def prefetch(self, version: str, kinds: tuple[Literal["iso", "disk"], ...] = ("iso", "disk")) -> None:
+        """Cache the images of a version ahead of an upgrade, nothing uses them yet."""
+        for kind in kinds:
+            self.get(version, kind)
+
+
+@functools.cache
+def get_talos_image_cache() -> TalosImageCache:
+    """
+    The shared image cache, created on first use.
+
+    Images of `cluster_settings.prefetch_talos_version` are fetched into it ahead of an upgrade.
+    """
+    proxmox_settings = get_proxmox_settings()
+    cluster_settings = get_cluster_settings()
+    cache = TalosImageCache(
+        datastore_id=cluster_settings.image_datastore,
+        node_name=proxmox_settings.node_name,
+        checksums=cluster_settings.image_checksums,
+    )
+    if cluster_settings.prefetch_talos_version:
+        cache.prefetch(cluster_settings.prefetch_talos_version)
+    retain_legacy_talos_iso()
+    return cache
+
+
+def retain_legacy_talos_iso() -> None:
+    """
+    Keep the ISO downloaded before the image cache existed on disk.
+
+    It was the "talos-iso" resource, without retain_on_delete, and VMs installed from
+    it still mount it (their cdrom is in ignore_changes), so simply dropping it from
+    the program would delete a file they need to start. While the file is there it's
+    declared with its original inputs plus retain_on_delete: Pulumi records the option
+    without touching the file, and once this is gone the file is left in place. A
+    stack that never managed the file would fail to create it, as it already exists.
+    """
+    proxmox_settings = get_proxmox_settings()
+    cluster_settings = get_cluster_settings()
+    version = cluster_settings.talos_version
+    file_name = f"talos-{version}-amd64.iso"
+    if find_file("local", proxmox_settings.node_name, file_name) is None:
+        return
+    proxmoxve.download.File(
+        LEGACY_ISO_RESOURCE,
         content_type="iso",
         datastore_id="local",
         node_name=proxmox_settings.node_name,
-        url=iso_url,
-        file_name=f"talos-{version}-amd64.iso",
+        url=get_talos_iso_url(version),
+        file_name=file_name,
         overwrite=False,
         upload_timeout=600,
         verify=True,
-        opts=pulumi.ResourceOptions(provider=proxmox_provider),
+        opts=pulumi.ResourceOptions(provider=get_proxmox_provider(), retain_on_delete=True),
     )
 
-    return talos_iso
+
+def download_talos_iso() -> pulumi.Output[str]:
+    """
+    Get the Talos Linux ISO onto Proxmox storage, through the image cache.
+
+    Uses the Talos Image Factory to get an ISO with:
+    - QEMU guest agent extension (required for Proxmox VM management)
+    - Tailscale extension (for VPN networking)
+
+    Returns:
+        File ID of the ISO
+    """
+    cluster_settings = get_cluster_settings()
+    return get_talos_image_cache().get(cluster_settings.talos_version, "iso")
+
+
+def download_talos_disk_image() -> pulumi.Output[str]:
+    """
+    Get the Talos raw disk image onto Proxmox storage, for template-clone provisioning.
+
+    The image is already installed, so a VM whose disk is imported from it boots
+    straight from disk into maintenance mode instead of installing from the ISO.
+
+    Returns:
+        File ID of the disk image
+    """
+    cluster_settings = get_cluster_settings()
+    return get_talos_image_cache().get(cluster_settings.talos_version, "disk")
 
 
-# Export the ISO resource
-talos_iso = download_talos_iso()
@@ -0,0 +1,173 @@
+from dataclasses import dataclass, field
+
+import pulumi
+import pulumi_proxmoxve as proxmoxve
+from config.settings import get_proxmox_settings, get_cluster_settings
+from config.nodes import NodeSpec
+from infrastructure.provider import get_proxmox_provider
+
+
+@dataclass
+class HostCapacity:
+    """Free resources on one Proxmox host, as seen before this run places anything."""
+
+    name: str
+    cpus: int
+    memory_mb: int
+    disk_gb: int
+    # Datastore the disk space comes from, hosts sharing it share `disk_gb`
+    datastore: str = ""
+    shared_datastore: bool = False
+    vcpus_placed: int = 0
+    control_planes: list[str] = field(default_factory=list)
+
+
+def get_host_capacities(hosts: list[str]) -> list[HostCapacity]:
+    """
+    Read CPU, free memory and free space on the VM datastore for each Proxmox host.
+
+    Args:
+        hosts: Proxmox node names to consider
+
+    Returns:
+        One HostCapacity per online host
+    """
+    cluster_settings = get_cluster_settings()
+    invoke_opts = pulumi.InvokeOptions(provider=get_proxmox_provider())
+    nodes = proxmoxve.cluster.get_nodes(opts=invoke_opts)
+    capacities = []
+    for name, cpus, memory_available, online in zip(nodes.names, nodes.cpu_counts, nodes.memory_availables, nodes.onlines):
+        if name not in hosts or not online:
+            continue
+        datastores = proxmoxve.storage.get_datastores(node_name=name, filters={"id": cluster_settings.storage_pool}, opts=invoke_opts).datastores or []
+        datastore = datastores[0] if datastores else None
+        capacities.append(HostCapacity(
+            name=name,
+            cpus=cpus,
+            memory_mb=memory_available // (1024 * 1024),
+            disk_gb=(datastore.space_available or 0) // (1024 ** 3) if datastore else 0,
+            datastore=cluster_settings.storage_pool,
+            shared_datastore=bool(datastore and datastore.shared),
+        ))
+    return capacities
+
+
+def get_existing_placements(node_specs: list[NodeSpec]) -> dict[str, str]:
+    """Find which host each already created node VM is on, by VM ID."""
+    vm_ids = {spec.vm_id: spec.name for spec in node_specs}
+    vms = proxmoxve.vm.get_virtual_machines(opts=pulumi.InvokeOptions(provider=get_proxmox_provider())).vms
+    return {vm_ids[vm.vm_id]: vm.node_name for vm in vms if vm.vm_id in vm_ids}
+
+
+def place_nodes(
+    node_specs: list[NodeSpec],
+    hosts: list[HostCapacity],
+    existing: dict[str, str],
+    cpu_overcommit: float = 4.0,
+) -> dict[str, str]:
+    """
+    Assign every node to a Proxmox host.
+
+    - Nodes that already exist stay where they are, so re-runs never move VMs. If
+      their host is offline or no longer listed placement fails instead.
+    - New nodes are bin-packed best-fit decreasing: control planes first, then by
+      memory, each onto the host that is left with the least free memory.
+    - Control planes never share a host (anti-affinity).
+    - A host takes at most `cpus * cpu_overcommit` vCPUs from these nodes.
+
+    Args:
+        node_specs: Nodes to place
+        hosts: Host capacities from get_host_capacities()
+        existing: Node name -> host for VMs that already exist
+        cpu_overcommit: vCPUs allowed per physical CPU
+
+    Returns:
+        Node name -> host name
+    """
+    by_name = {host.name: host for host in hosts}
+    shared_disk = {host.datastore: host.disk_gb for host in hosts if host.shared_datastore}
+    placements: dict[str, str] = {}
+
+    def reserve(spec: NodeSpec, host: HostCapacity, new: bool) -> None:
+        host.vcpus_placed += spec.cpu_cores
+        if spec.role == "controlplane":
+            host.control_planes.append(spec.name)
+        if not new:
+            # Memory and disk of running VMs are already out of the free figures
+            return
+        host.memory_mb -= spec.memory_mb
+        if host.shared_datastore:
+            shared_disk[host.datastore] -= spec.disk_gb
+        else:
+            host.disk_gb -= spec.disk_gb
+
+    def fits(spec: NodeSpec, host: HostCapacity) -> bool:
+        disk_free = shared_disk[host.datastore] if host.shared_datastore else host.disk_gb
+        return (
+            host.memory_mb >= spec.memory_mb
+            and disk_free >= spec.disk_gb
+            and host.vcpus_placed + spec.cpu_cores <= host.cpus * cpu_overcommit
+            and not (spec.role == "controlplane" and host.control_planes)
+        )
+
+    for spec in node_specs:
+        if spec.name not in existing:
+            continue
+        host = by_name.get(existing[spec.name])
+        if host is None:
+            # Placing it again would change its node_name and replace the VM
+            raise ValueError(f"{spec.name} exists on {existing[spec.name]}, which is offline or not in proxmox_hosts, and existing VMs are never moved")
+        placements[spec.name] = host.name
+        reserve(spec, host, new=False)
+
+    pending = [spec for spec in node_specs if spec.name not in placements]
+    pending.sort(key=lambda spec: (spec.role != "controlplane", -spec.memory_mb, -spec.disk_gb, spec.name))
+    for spec in pending:
+        candidates = [host for host in hosts if fits(spec, host)]
+        if not candidates:
+            raise ValueError(f"No Proxmox host has room for {spec.name} ({spec.cpu_cores} CPU, {spec.memory_mb}MB, {spec.disk_gb}GB, {spec.role})")
+        host = min(candidates, key=lambda host: (host.memory_mb - spec.memory_mb, host.name))
+        placements[spec.name] = host.name
+        reserve(spec, host, new=True)
+
+    return placements
+
+
+def plan_placements(node_specs: list[NodeSpec]) -> dict[str, str]:
+    """
+    Decide the Proxmox host of every node.
+
+    With no `proxmox_settings.hosts` configured everything goes on
+    `proxmox_settings.node_name`, as before, without querying the cluster.
+    Clone provisioning across hosts needs `storage_pool` to be shared, since
+    the template only exists on `proxmox_settings.node_name`.
+
+    Args:
+        node_specs: Nodes to place
+
+    Returns:
+        Node name -> host name
+    """
+    proxmox_settings = get_proxmox_settings()
+    cluster_settings = get_cluster_settings()
+    if not proxmox_settings.hosts:
+        return {spec.name: proxmox_settings.node_name for spec in node_specs}
+
+    hosts = get_host_capacities(proxmox_settings.hosts)
+    # The template lives on node_name, Proxmox only clones to another host from shared storage
+    unreachable = [host.name for host in hosts if host.name != proxmox_settings.node_name and not host.shared_datastore]
+    if cluster_settings.provisioning == "clone" and unreachable:
+        raise ValueError(
+            f"provisioning=clone across hosts needs a shared storage_pool, {cluster_settings.storage_pool} isn't shared "
+            f"with {', '.join(unreachable)}; use provisioning=iso or shared storage"
+        )
+
+    placements = place_nodes(
+        node_specs,
+        hosts,
+        get_existing_placements(node_specs),
+        cpu_overcommit=proxmox_settings.cpu_overcommit,
+    )
+    for spec in node_specs:
+        pulumi.log.info(f"{spec.name} placed on {placements[spec.name]}")
+    return placements
@@ -1,5 +1,7 @@
+import functools
+
 import pulumi_proxmoxve as proxmoxve
-from config.settings import proxmox_settings
+from config.settings import get_proxmox_settings
 
 
 def create_proxmox_provider() -> proxmoxve.Provider:
@@ -9,6 +11,7 @@ def create_proxmox_provider() -> proxmoxve.Provider:
     Authentication uses API token from environment variables.
     The token format should be: user@realm!token-id=secret
     """
+    proxmox_settings = get_proxmox_settings()
     return proxmoxve.Provider(
         "proxmox-provider",
         endpoint=proxmox_settings.endpoint,
@@ -18,5 +21,8 @@ def create_proxmox_provider() -> proxmoxve.Provider:
     )
 
 
-# Singleton provider instance
-proxmox_provider = create_proxmox_provider()
+
+@functools.cache
+def get_proxmox_provider() -> proxmoxve.Provider:
+    """The program's Proxmox VE provider, created on first use."""
+    return create_proxmox_provider()
@@ -1,12 +1,77 @@
 import pulumi
 import pulumi_proxmoxve as proxmoxve
-from config.settings import proxmox_settings, cluster_settings
-from config.nodes import NodeSpec, CONTROL_PLANE_NODES, WORKER_NODES
-from infrastructure.provider import proxmox_provider
-from infrastructure.iso import talos_iso
+from config.settings import get_proxmox_settings, get_cluster_settings
+from config.nodes import NodeSpec, ALL_NODES
+from infrastructure.provider import get_proxmox_provider
+from infrastructure.iso import get_talos_image_cache, download_talos_iso, download_talos_disk_image, TALOS_SCHEMATIC_ID
+from infrastructure.placement import plan_placements
 
 
-def create_talos_vm(spec: NodeSpec) -> proxmoxve.vm.VirtualMachine:
+def create_talos_template() -> proxmoxve.vm.VirtualMachine:
+    """
+    Create a Proxmox template VM with Talos preinstalled on its disk.
+
+    The disk is imported from the Image Factory raw image for the configured
+    version and schematic, so clones boot straight into maintenance mode. Each
+    version/schematic gets its own template; old ones are left on Proxmox when the
+    version moves on because linked clones still read from their disks.
+
+    Returns:
+        The template VirtualMachine resource
+    """
+    proxmox_settings = get_proxmox_settings()
+    cluster_settings = get_cluster_settings()
+    disk_image_id = download_talos_disk_image()
+    label = f"{cluster_settings.talos_version}-{TALOS_SCHEMATIC_ID[:12]}"
+
+    return proxmoxve.vm.VirtualMachine(
+        f"talos-template-{label}",
+        name=f"talos-{label}".replace(".", "-"),
+        node_name=proxmox_settings.node_name,
+        template=True,
+        started=False,
+        bios="seabios",
+        machine="q35",
+        cpu=proxmoxve.vm.VirtualMachineCpuArgs(cores=2, sockets=1, type="host"),
+        memory=proxmoxve.vm.VirtualMachineMemoryArgs(dedicated=2048, floating=0),
+        agent=proxmoxve.vm.VirtualMachineAgentArgs(enabled=True, type="virtio"),
+        boot_orders=["scsi0"],
+        disks=[
+            proxmoxve.vm.VirtualMachineDiskArgs(
+                interface="scsi0",
+                datastore_id=cluster_settings.storage_pool,
+                file_id=disk_image_id,
+                size=10,
+                file_format="raw",
+                iothread=True,
+                ssd=True,
+                discard="on",
+            ),
+        ],
+        network_devices=[
+            proxmoxve.vm.VirtualMachineNetworkDeviceArgs(
+                bridge=cluster_settings.network_bridge,
+                model="virtio",
+                firewall=False,
+            ),
+        ],
+        operating_system=proxmoxve.vm.VirtualMachineOperatingSystemArgs(
+            type="l26",
+        ),
+        scsi_hardware="virtio-scsi-single",
+        opts=pulumi.ResourceOptions(
+            provider=get_proxmox_provider(),
+            retain_on_delete=True,
+        ),
+    )
+
+
+def create_talos_vm(
+    spec: NodeSpec,
+    depends_on: list[pulumi.Resource] | None = None,
+    template: proxmoxve.vm.VirtualMachine | None = None,
+    host: str | None = None,
+) -> proxmoxve.vm.VirtualMachine:
     """
     Create a Talos Linux VM on Proxmox with the specified configuration.
 
@@ -16,16 +81,85 @@ def create_talos_vm(spec: NodeSpec) -> proxmoxve.vm.VirtualMachine:
     - QEMU guest agent should be enabled for VM lifecycle management
     - Boot order: cdrom first for initial install, then disk
 
+    NUMA, CPU pinning and weight, hugepages, disk cache/AIO and NIC queues come
+    from the node's performance profile (see config/profiles.py).
+
+    With a template the VM is cloned from it instead (linked unless
+    `cluster_settings.clone_full`) and boots from the cloned disk, skipping the install.
+
     Args:
         spec: Node specification with CPU, memory, disk, and role
+        depends_on: Resources to wait for besides the image or template
+        template: Talos template VM to clone from
+        host: Proxmox host to create the VM on, defaults to proxmox_settings.node_name
 
     Returns:
         The created VirtualMachine resource
     """
+    proxmox_settings = get_proxmox_settings()
+    cluster_settings = get_cluster_settings()
+    host = host or proxmox_settings.node_name
+    profile = spec.profile
+
+    disks = [
+        proxmoxve.vm.VirtualMachineDiskArgs(
+            interface="scsi0",
+            datastore_id=cluster_settings.storage_pool,
+            size=spec.disk_gb,
+            file_format="raw",
+            iothread=True,
+            ssd=True,
+            discard="on",
+            cache=profile.disk_cache,
+            aio=profile.disk_aio,
+        ),
+    ]
+    if spec.role == "controlplane" and cluster_settings.etcd_disk_gb:
+        # etcd on its own disk and iothread, so its fsyncs don't queue behind image pulls and logs.
+        # Talos mounts it at /var/lib/etcd (see get_control_plane_config_patches)
+        disks.append(proxmoxve.vm.VirtualMachineDiskArgs(
+            interface="scsi1",
+            datastore_id=cluster_settings.etcd_datastore or cluster_settings.storage_pool,
+            size=cluster_settings.etcd_disk_gb,
+            file_format="raw",
+            iothread=True,
+            ssd=True,
+            discard="on",
+            cache="none",
+            aio="native",
+            backup=False,
+        ))
+    if template is not None:
+        boot_source = {
+            "clone": proxmoxve.vm.VirtualMachineCloneArgs(
+                vm_id=template.vm_id,
+                node_name=template.node_name,
+                full=cluster_settings.clone_full,
+                # Proxmox only takes a target storage for full clones, linked clones stay on the template's
+                datastore_id=cluster_settings.storage_pool if cluster_settings.clone_full else None,
+                retries=3,
+            ),
+            "boot_orders": ["scsi0"],
+        }
+        # Existing nodes keep their disks when a new template replaces the old one
+        resource_options = pulumi.ResourceOptions(provider=get_proxmox_provider(), depends_on=[template] + (depends_on or []), ignore_changes=["clone"])
+    else:
+        boot_source = {
+            # Boot from ISO initially using CD-ROM
+            "cdrom": proxmoxve.vm.VirtualMachineCdromArgs(
+                file_id=download_talos_iso() if host == proxmox_settings.node_name else get_talos_image_cache().get(cluster_settings.talos_version, "iso", node_name=host),
+                interface="ide2",
+            ),
+            # Boot order: cdrom first for initial install, then disk
+            "boot_orders": ["ide2", "scsi0"],
+        }
+        # The ISO only matters for the install, version changes are rolled out by talos/upgrade.py
+        resource_options = pulumi.ResourceOptions(provider=get_proxmox_provider(), depends_on=depends_on or [], ignore_changes=["cdrom"])
+
     vm = proxmoxve.vm.VirtualMachine(
         f"vm-{spec.name}",
         name=spec.name,
-        node_name=proxmox_settings.node_name,
+        node_name=host,
         vm_id=spec.vm_id,
         # Machine configuration
         bios="seabios",
@@ -36,42 +170,33 @@ def create_talos_vm(spec: NodeSpec) -> proxmoxve.vm.VirtualMachine:
             cores=spec.cpu_cores,
             sockets=1,
             type="host",
+            numa=profile.numa or bool(profile.hugepages),
+            affinity=profile.cpu_affinity or None,
+            units=profile.cpu_units,
         ),
         # Memory - DO NOT enable hotplug for Talos (floating must be 0)
         memory=proxmoxve.vm.VirtualMachineMemoryArgs(
             dedicated=spec.memory_mb,
             floating=0,
+            hugepages=profile.hugepages or None,
+            keep_hugepages=True if profile.hugepages else None,
         ),
         # QEMU guest agent for VM lifecycle management
         agent=proxmoxve.vm.VirtualMachineAgentArgs(
             enabled=True,
             type="virtio",
         ),
-        # Boot from ISO initially using CD-ROM
-        cdrom=proxmoxve.vm.VirtualMachineCdromArgs(
-            file_id=talos_iso.id,
-            interface="ide2",
-        ),
-        # Boot order: cdrom first for initial install, then disk
-        boot_orders=["ide2", "scsi0"],
+        # Installer ISO, or the template to clone
+        **boot_source,
         # Disk configuration
-        disks=[
-            proxmoxve.vm.VirtualMachineDiskArgs(
-                interface="scsi0",
-                datastore_id=cluster_settings.storage_pool,
-                size=spec.disk_gb,
-                file_format="raw",
-                iothread=True,
-                ssd=True,
-                discard="on",
-            ),
-        ],
+        disks=disks,
         # Network configuration - DHCP will assign IPs
         network_devices=[
             proxmoxve.vm.VirtualMachineNetworkDeviceArgs(
                 bridge=cluster_settings.network_bridge,
                 model="virtio",
                 firewall=False,
+                queues=profile.net_queues(spec.cpu_cores),
             ),
         ],
         # Operating system type - Linux 2.6+ kernel
@@ -86,10 +211,7 @@ def create_talos_vm(spec: NodeSpec) -> proxmoxve.vm.VirtualMachine:
         # Timeouts for creation
         timeout_create=300,
         timeout_clone=300,
-        opts=pulumi.ResourceOptions(
-            provider=proxmox_provider,
-            depends_on=[talos_iso],
-        ),
+        opts=resource_options,
     )
 
     return vm
@@ -97,11 +219,31 @@ def create_talos_vm(spec: NodeSpec) -> proxmoxve.vm.VirtualMachine:
 
 def create_all_vms() -> tuple[list[proxmoxve.vm.VirtualMachine], list[proxmoxve.vm.VirtualMachine]]:
     """
-    Create all control plane and worker VMs.
+    Create all control plane and worker VMs from the node pools.
+
+    At most `cluster_settings.vm_create_concurrency` VMs are created at once: the
+    nodes are dealt into that many lanes and each VM waits for the previous one in
+    its lane, so a large pool doesn't hit the Proxmox host with every create at once.
+
+    With `cluster_settings.provisioning` set to "clone" the nodes are cloned from a
+    Talos template instead of installing from the ISO. Hosts come from the
+    placement scheduler when `proxmox_settings.hosts` lists more than one.
 
     Returns:
         Tuple of (control_plane_vms, worker_vms)
     """
-    control_plane_vms = [create_talos_vm(spec) for spec in CONTROL_PLANE_NODES]
-    worker_vms = [create_talos_vm(spec) for spec in WORKER_NODES]
+    cluster_settings = get_cluster_settings()
+    if cluster_settings.vm_create_concurrency < 1:
+        raise ValueError(f"vm_create_concurrency must be at least 1, got {cluster_settings.vm_create_concurrency}")
+
+    template = create_talos_template() if cluster_settings.provisioning == "clone" else None
+    placements = plan_placements(ALL_NODES)
+
+    vms: list[proxmoxve.vm.VirtualMachine] = []
+    for i, spec in enumerate(ALL_NODES):
+        lane_previous = vms[i - cluster_settings.vm_create_concurrency] if i >= cluster_settings.vm_create_concurrency else None
+        vms.append(create_talos_vm(spec, depends_on=[lane_previous] if lane_previous else None, template=template, host=placements[spec.name]))
+
+    control_plane_vms = [vm for spec, vm in zip(ALL_NODES, vms) if spec.role == "controlplane"]
+    worker_vms = [vm for spec, vm in zip(ALL_NODES, vms) if spec.role == "worker"]
     return control_plane_vms, worker_vms
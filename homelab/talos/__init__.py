@@ -1,12 +1,18 @@
-from .secrets import machine_secrets
-from .config import generate_machine_configuration, get_config_patches
+from .secrets import get_machine_secrets
+from .config import TuningProfile, TUNING_PROFILES, generate_role_configuration, get_config_patches, get_node_config_patches
 from .bootstrap import bootstrap_cluster, get_kubeconfig, get_talosconfig
+from .upgrade import ClusterUpgrade, create_cluster_upgrade
 
 __all__ = [
-    "machine_secrets",
-    "generate_machine_configuration",
+    "get_machine_secrets",
+    "TuningProfile",
+    "TUNING_PROFILES",
+    "generate_role_configuration",
     "get_config_patches",
+    "get_node_config_patches",
     "bootstrap_cluster",
     "get_kubeconfig",
     "get_talosconfig",
+    "ClusterUpgrade",
+    "create_cluster_upgrade",
 ]
@@ -1,40 +1,39 @@
 import pulumi
 import pulumiverse_talos as talos
 import pulumi_proxmoxve as proxmoxve
-from config.settings import cluster_settings
+from config.settings import get_cluster_settings
 from config.nodes import NodeSpec, CONTROL_PLANE_NODES, WORKER_NODES
-from talos.secrets import machine_secrets
-from talos.config import generate_machine_configuration
+from talos.secrets import get_machine_secrets
+from talos.config import generate_role_configuration, get_node_config_patches
+from infrastructure.addresses import node_ip
+from talos.upgrade import ClusterUpgrade, create_cluster_upgrade
 
 
 def apply_configuration_to_node(
     node: NodeSpec,
     vm: proxmoxve.vm.VirtualMachine,
     depends_on: list[pulumi.Resource],
+    upgrade: ClusterUpgrade,
 ) -> talos.machine.ConfigurationApply:
     """
     Apply Talos configuration to a specific node.
 
     IMPORTANT: Since nodes use DHCP, we need to discover the IP from Proxmox
-    after the VM boots. The VM's ipv4_addresses output is populated by the
-    QEMU guest agent once the VM is running.
+    after the VM boots. node_ip() waits for the QEMU guest agent to report it
+    and keeps it in the stack state.
 
     Args:
         node: Node specification
         vm: The Proxmox VM resource
         depends_on: Resources this depends on
+        upgrade: Cluster upgrade resource whose versions the configuration is generated for
 
     Returns:
         ConfigurationApply resource
     """
-    # Generate machine configuration for this node
-    config = generate_machine_configuration(node)
-
-    # Get the first IPv4 address from the VM's guest agent
-    # This is populated after the VM boots and the guest agent reports IPs
-    node_ip = vm.ipv4_addresses.apply(
-        lambda addrs: addrs[1][0] if addrs and len(addrs) > 1 and addrs[1] else addrs[0][0] if addrs and addrs[0] else ""
-    )
+    machine_secrets = get_machine_secrets()
+    # Shared configuration for the node's role, with its own hostname and Tailscale identity on top
+    config = generate_role_configuration(node.role, upgrade.talos_version, upgrade.kubernetes_version, node.tuning)
 
     return talos.machine.ConfigurationApply(
         f"config-apply-{node.name}",
@@ -44,14 +43,19 @@ def apply_configuration_to_node(
             "client_key": machine_secrets.client_configuration.client_key,
         },
         machine_configuration_input=config.machine_configuration,
-        node=node_ip,
-        apply_mode="reboot",
+        # The Tailscale patch carries TS_AUTHKEY, keep it encrypted in the state and out of previews
+        config_patches=pulumi.Output.secret(get_node_config_patches(node)),
+        node=node_ip(node, vm),
+        # Maintenance mode installs and reboots regardless; on a running node only reboot if the change needs it,
+        # version changes have already been rolled out one node at a time by the ClusterUpgrade
+        apply_mode="auto",
         timeouts={
             "create": "15m",
             "update": "15m",
         },
         opts=pulumi.ResourceOptions(
             depends_on=depends_on + [vm],
+            additional_secret_outputs=["configPatches"],
         ),
     )
 
@@ -65,8 +69,18 @@ def bootstrap_cluster(
 
     Steps:
     1. Apply configuration to all control plane nodes
-    2. Apply configuration to all worker nodes
-    3. Bootstrap the cluster on the first control plane node
+    2. Bootstrap the cluster on the first control plane node
+    3. Apply configuration to all worker nodes
+
+    Version changes go through the ClusterUpgrade (see talos/upgrade.py), which
+    upgrades the nodes one at a time or in worker batches before their
+    configuration is regenerated for the new version.
+
+    Worker applies are scheduled by `cluster_settings.worker_apply`. By default
+    ("parallel") they only wait for their own VM, so workers install and reboot at
+    the same time as the control planes instead of after them; a configured worker
+    keeps retrying the cluster endpoint and joins once the bootstrap is done.
+    "after-bootstrap" and "after-control-plane" hold them back until then.
 
     IMPORTANT: This process requires the QEMU guest agent to report VM IPs.
     The VMs must boot fully and the guest agent must be running before
@@ -75,7 +89,10 @@ def bootstrap_cluster(
     Returns:
         Tuple of (all config applies, bootstrap resource)
     """
+    cluster_settings = get_cluster_settings()
+    machine_secrets = get_machine_secrets()
     config_applies: list[talos.machine.ConfigurationApply] = []
+    upgrade = create_cluster_upgrade(control_plane_vms, worker_vms)
 
     # Step 1: Apply configuration to control plane nodes
     for i, node in enumerate(CONTROL_PLANE_NODES):
@@ -84,33 +101,17 @@ def bootstrap_cluster(
             node=node,
             vm=vm,
             depends_on=[],
+            upgrade=upgrade,
         )
         config_applies.append(apply)
 
-    # Step 2: Apply configuration to worker nodes
-    # Workers depend on control plane being configured
-    for i, node in enumerate(WORKER_NODES):
-        vm = worker_vms[i]
-        apply = apply_configuration_to_node(
-            node=node,
-            vm=vm,
-            depends_on=config_applies[:len(CONTROL_PLANE_NODES)],
-        )
-        config_applies.append(apply)
-
-    # Step 3: Bootstrap cluster on first control plane node
-    first_control_plane = CONTROL_PLANE_NODES[0]
+    # Step 2: Bootstrap cluster on first control plane node
     first_control_plane_apply = config_applies[0]
     first_vm = control_plane_vms[0]
 
-    # Get the first control plane's IP for bootstrap
-    first_node_ip = first_vm.ipv4_addresses.apply(
-        lambda addrs: addrs[1][0] if addrs and len(addrs) > 1 and addrs[1] else addrs[0][0] if addrs and addrs[0] else ""
-    )
-
     bootstrap = talos.machine.Bootstrap(
         "talos-bootstrap",
-        node=first_node_ip,
+        node=node_ip(CONTROL_PLANE_NODES[0], first_vm),
         client_configuration={
             "ca_certificate": machine_secrets.client_configuration.ca_certificate,
             "client_certificate": machine_secrets.client_configuration.client_certificate,
@@ -124,6 +125,25 @@ def bootstrap_cluster(
         ),
     )
 
+    # Step 3: Apply configuration to worker nodes
+    worker_depends_on: dict[str, list[pulumi.Resource]] = {
+        "parallel": [],
+        "after-bootstrap": [bootstrap],
+        "after-control-plane": config_applies[:len(CONTROL_PLANE_NODES)],
+    }
+    if cluster_settings.worker_apply not in worker_depends_on:
+        raise ValueError(f"Unknown worker_apply {cluster_settings.worker_apply!r}, expected one of {', '.join(worker_depends_on)}")
+
+    for i, node in enumerate(WORKER_NODES):
+        vm = worker_vms[i]
+        apply = apply_configuration_to_node(
+            node=node,
+            vm=vm,
+            depends_on=worker_depends_on[cluster_settings.worker_apply],
+            upgrade=upgrade,
+        )
+        config_applies.append(apply)
+
     return config_applies, bootstrap
 
 
@@ -141,14 +161,10 @@ def get_kubeconfig(
     Returns:
         Kubeconfig resource
     """
-    # Get the first control plane's IP
-    node_ip = first_vm.ipv4_addresses.apply(
-        lambda addrs: addrs[1][0] if addrs and len(addrs) > 1 and addrs[1] else addrs[0][0] if addrs and addrs[0] else ""
-    )
-
+    machine_secrets = get_machine_secrets()
     kubeconfig = talos.cluster.Kubeconfig(
         "talos-kubeconfig",
-        node=node_ip,
+        node=node_ip(CONTROL_PLANE_NODES[0], first_vm),
         client_configuration={
             "ca_certificate": machine_secrets.client_configuration.ca_certificate,
             "client_certificate": machine_secrets.client_configuration.client_certificate,
@@ -166,6 +182,8 @@ def get_talosconfig() -> pulumi.Output[str]:
 
     This allows direct interaction with Talos nodes using the CLI.
     """
+    cluster_settings = get_cluster_settings()
+    machine_secrets = get_machine_secrets()
     return pulumi.Output.all(
         machine_secrets.client_configuration.ca_certificate,
         machine_secrets.client_configuration.client_certificate,
@@ -1,21 +1,120 @@
+import functools
 import json
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
 import pulumi
 import pulumiverse_talos as talos
-from config.settings import cluster_settings, tailscale_settings
+from config.settings import get_cluster_settings, get_tailscale_settings
 from config.nodes import NodeSpec, CONTROL_PLANE_NODES
-from talos.secrets import machine_secrets
+from talos.secrets import get_machine_secrets
 from infrastructure.iso import get_talos_installer_image
 
+# Device of the optional etcd disk (scsi1) inside the control plane VMs
+ETCD_DISK_DEVICE = "/dev/sdb"
+
+
+@dataclass(frozen=True)
+class TuningProfile:
+    """Kernel, sysctl and kubelet tuning for a node pool, rendered as one config patch."""
+
+    sysctls: dict[str, str] = field(default_factory=dict)
+    # Only take effect on install and upgrade, when Talos rewrites the boot entry
+    kernel_args: tuple[str, ...] = ()
+    kubelet_extra_config: dict[str, Any] = field(default_factory=dict)
+    udev_rules: tuple[str, ...] = ()
+
+
+# Bigger socket buffers and backlogs for 10GbE-class traffic, and room in conntrack for many pods' connections
+_NETWORK_SYSCTLS = {
+    "net.core.rmem_max": "16777216",
+    "net.core.wmem_max": "16777216",
+    "net.ipv4.tcp_rmem": "4096 87380 16777216",
+    "net.ipv4.tcp_wmem": "4096 65536 16777216",
+    "net.core.netdev_max_backlog": "16384",
+    "net.core.somaxconn": "8192",
+    "net.netfilter.nf_conntrack_max": "524288",
+}
+
+TUNING_PROFILES: dict[str, TuningProfile] = {
+    "default": TuningProfile(),
+    "control-plane": TuningProfile(
+        sysctls={
+            **_NETWORK_SYSCTLS,
+            # Keep etcd and the apiserver in memory
+            "vm.swappiness": "0",
+        },
+        kernel_args=("cpufreq.default_governor=performance",),
+        kubelet_extra_config={
+            "systemReserved": {"cpu": "500m", "memory": "1Gi"},
+        },
+    ),
+    "nfs-worker": TuningProfile(
+        sysctls={
+            **_NETWORK_SYSCTLS,
+            # Start writeback early and cap dirty pages, so NFS flushes are steady instead of bursty
+            "vm.dirty_background_ratio": "5",
+            "vm.dirty_ratio": "10",
+        },
+        kernel_args=("cpufreq.default_governor=performance",),
+        kubelet_extra_config={
+            "serializeImagePulls": False,
+            "maxParallelImagePulls": 4,
+            "systemReserved": {"cpu": "250m", "memory": "512Mi"},
+        },
+        # NFS mounts get anonymous (major 0) backing devices, give them a 16MB read-ahead
+        udev_rules=('SUBSYSTEM=="bdi", ACTION=="add", KERNEL=="0:*", ATTR{read_ahead_kb}="16384"',),
+    ),
+    "database": TuningProfile(
+        sysctls={
+            **_NETWORK_SYSCTLS,
+            # 4096 x 2MB = 8GB, reserved at boot before memory fragments. The kubelet advertises
+            # them as hugepages-2Mi and takes them out of allocatable memory itself
+            "vm.nr_hugepages": "4096",
+            "vm.swappiness": "1",
+        },
+        kubelet_extra_config={
+            "systemReserved": {"cpu": "250m", "memory": "1Gi"},
+        },
+    ),
+}
+
+
+def get_tuning_config_patch(name: str) -> str | None:
+    """
+    Render a tuning profile as a machine config patch.
+
+    Args:
+        name: Key in TUNING_PROFILES
+
+    Returns:
+        JSON patch, or None for a profile that changes nothing
+    """
+    if name not in TUNING_PROFILES:
+        raise ValueError(f"Unknown tuning profile {name!r}, expected one of {', '.join(TUNING_PROFILES)}")
+    profile = TUNING_PROFILES[name]
+
+    machine: dict[str, Any] = {}
+    if profile.sysctls:
+        machine["sysctls"] = profile.sysctls
+    if profile.kernel_args:
+        machine["install"] = {"extraKernelArgs": list(profile.kernel_args)}
+    if profile.kubelet_extra_config:
+        machine["kubelet"] = {"extraConfig": profile.kubelet_extra_config}
+    if profile.udev_rules:
+        machine["udev"] = {"rules": list(profile.udev_rules)}
+    return json.dumps({"machine": machine}) if machine else None
+
 
-def get_base_config_patches(node: NodeSpec) -> list[str]:
+def get_base_config_patches() -> list[str]:
     """
     Generate base config patches applied to all nodes.
 
     Includes:
     - Install disk configuration
-    - Hostname
     - DHCP networking (default)
     """
+    cluster_settings = get_cluster_settings()
     patches = [
         # Install disk and installer image configuration
         json.dumps({
@@ -28,19 +127,24 @@ def get_base_config_patches(node: NodeSpec) -> list[str]:
                 },
             },
         }),
-        # Set hostname
-        json.dumps({
-            "machine": {
-                "network": {
-                    "hostname": node.name,
-                },
-            },
-        }),
     ]
 
     return patches
 
 
+def get_hostname_config_patch(node: NodeSpec) -> str:
+    """
+    Generate the hostname patch for a node.
+    """
+    return json.dumps({
+        "machine": {
+            "network": {
+                "hostname": node.name,
+            },
+        },
+    })
+
+
 def get_tailscale_config_patch(node: NodeSpec) -> str:
     """
     Generate Tailscale extension configuration patch.
@@ -48,6 +152,7 @@ def get_tailscale_config_patch(node: NodeSpec) -> str:
     Configures the Tailscale extension to authenticate to the Tailnet
     using the provided auth key.
     """
+    tailscale_settings = get_tailscale_settings()
     return json.dumps({
         "machine": {
             "files": [
@@ -69,16 +174,25 @@ environment:
     })
 
 
-def get_control_plane_config_patches(node: NodeSpec, is_first: bool = False) -> list[str]:
+def get_control_plane_config_patches() -> list[str]:
     """
-    Generate config patches specific to control plane nodes.
-
-    Args:
-        node: Control plane node specification
-        is_first: Whether this is the first control plane node (for VIP)
+    Generate config patches shared by all control plane nodes.
     """
-    patches = get_base_config_patches(node)
-    patches.append(get_tailscale_config_patch(node))
+    cluster_settings = get_cluster_settings()
+    patches = get_base_config_patches()
+
+    # Dedicated etcd disk: the VM's scsi1, which is the second SCSI disk
+    if cluster_settings.etcd_disk_gb:
+        patches.append(json.dumps({
+            "machine": {
+                "disks": [
+                    {
+                        "device": ETCD_DISK_DEVICE,
+                        "partitions": [{"mountpoint": "/var/lib/etcd"}],
+                    },
+                ],
+            },
+        }))
 
     # Control plane specific configuration
     # Enable VIP on all control plane nodes (Talos will coordinate)
@@ -103,12 +217,11 @@ def get_control_plane_config_patches(node: NodeSpec, is_first: bool = False) ->
     return patches
 
 
-def get_worker_config_patches(node: NodeSpec) -> list[str]:
+def get_worker_config_patches() -> list[str]:
     """
-    Generate config patches specific to worker nodes.
+    Generate config patches shared by all worker nodes.
     """
-    patches = get_base_config_patches(node)
-    patches.append(get_tailscale_config_patch(node))
+    patches = get_base_config_patches()
 
     # Worker specific configuration
     patches.append(json.dumps({
@@ -127,43 +240,66 @@ def get_worker_config_patches(node: NodeSpec) -> list[str]:
     return patches
 
 
-def get_config_patches(node: NodeSpec) -> list[str]:
+def get_role_config_patches(role: Literal["controlplane", "worker"], tuning: str = "default") -> list[str]:
     """
-    Get all config patches for a node based on its role.
+    Get the config patches every node of a role and tuning profile has in common.
     """
-    if node.role == "controlplane":
-        is_first = node == CONTROL_PLANE_NODES[0]
-        return get_control_plane_config_patches(node, is_first)
+    if role == "controlplane":
+        patches = get_control_plane_config_patches()
     else:
-        return get_worker_config_patches(node)
+        patches = get_worker_config_patches()
+
+    tuning_patch = get_tuning_config_patch(tuning)
+    if tuning_patch:
+        patches.append(tuning_patch)
+    return patches
 
 
-def generate_machine_configuration(node: NodeSpec) -> pulumi.Output[talos.machine.GetConfigurationResult]:
+def get_node_config_patches(node: NodeSpec) -> list[str]:
     """
-    Generate Talos machine configuration for a specific node.
+    Get the patches that differ from node to node: hostname and Tailscale identity.
 
-    Args:
-        node: Node specification
+    These are layered on top of the role's base configuration when it is applied.
+    """
+    return [
+        get_hostname_config_patch(node),
+        get_tailscale_config_patch(node),
+    ]
 
-    Returns:
-        Machine configuration result wrapped in Output
+
+def get_config_patches(node: NodeSpec) -> list[str]:
+    """
+    Get all config patches for a node based on its role.
+    """
+    return get_role_config_patches(node.role, node.tuning) + get_node_config_patches(node)
+
+
+def get_cluster_endpoint() -> str:
+    """
+    Determine the cluster endpoint.
+
+    Use Tailscale VIP hostname if configured, otherwise use first control plane's Tailscale DNS.
     """
-    # Determine the cluster endpoint
-    # Use Tailscale VIP hostname if configured, otherwise use first control plane's Tailscale DNS
+    cluster_settings = get_cluster_settings()
     if cluster_settings.vip_hostname:
-        endpoint = f"https://{cluster_settings.vip_hostname}:6443"
-    else:
-        # Fallback to first control plane node's expected Tailscale DNS name
-        first_cp = CONTROL_PLANE_NODES[0]
-        endpoint = f"https://{first_cp.name}:6443"
-
-    # Workaround for Pulumi Python issue with composite output types
-    # See: https://github.com/pulumiverse/pulumi-talos/issues/93
-    #
-    # Convert machine_secrets to a plain dict using apply(), then pass that
-    # Output[dict] to get_configuration_output() which properly handles
-    # Output types for all parameters.
-    machine_secrets_dict = machine_secrets.machine_secrets.apply(
+        return f"https://{cluster_settings.vip_hostname}:6443"
+    # Fallback to first control plane node's expected Tailscale DNS name
+    return f"https://{CONTROL_PLANE_NODES[0].name}:6443"
+
+
+@functools.cache
+def get_machine_secrets_dict() -> pulumi.Output[dict]:
+    """
+    Convert machine_secrets to a plain dict, once for the whole program.
+
+    Workaround for Pulumi Python issue with composite output types
+    See: https://github.com/pulumiverse/pulumi-talos/issues/93
+
+    The resulting Output[dict] can be passed to get_configuration_output(),
+    which properly handles Output types for all parameters.
+    """
+    machine_secrets = get_machine_secrets()
+    return machine_secrets.machine_secrets.apply(
         lambda ms: {
             "certs": {
                 "etcd": {"cert": ms.certs.etcd.cert, "key": ms.certs.etcd.key},
@@ -184,15 +320,40 @@ def generate_machine_configuration(node: NodeSpec) -> pulumi.Output[talos.machin
         }
     )
 
-    config = talos.machine.get_configuration_output(
+
+@functools.cache
+def generate_role_configuration(
+    role: Literal["controlplane", "worker"],
+    talos_version: pulumi.Input[str] | None = None,
+    kubernetes_version: pulumi.Input[str] | None = None,
+    tuning: str = "default",
+) -> pulumi.Output[talos.machine.GetConfigurationResult]:
+    """
+    Generate the Talos machine configuration shared by every node of a role.
+
+    Generated once per role and tuning profile and reused by all their nodes, so
+    the number of get_configuration invokes doesn't grow with the node count.
+    Per-node settings come from get_node_config_patches() and are applied on top
+    by ConfigurationApply.
+
+    Args:
+        role: "controlplane" or "worker"
+        talos_version: Talos version the nodes run, defaults to cluster_settings.talos_version
+        kubernetes_version: Kubernetes version, empty for the Talos release's default
+        tuning: Tuning profile name, see TUNING_PROFILES
+
+    Returns:
+        Machine configuration result wrapped in Output
+    """
+    cluster_settings = get_cluster_settings()
+    return talos.machine.get_configuration_output(
         cluster_name=cluster_settings.name,
-        cluster_endpoint=endpoint,
-        machine_type=node.role,
-        machine_secrets=machine_secrets_dict,
-        talos_version=cluster_settings.talos_version,
-        config_patches=get_config_patches(node),
+        cluster_endpoint=get_cluster_endpoint(),
+        machine_type=role,
+        machine_secrets=get_machine_secrets_dict(),
+        talos_version=talos_version or cluster_settings.talos_version,
+        kubernetes_version=pulumi.Output.from_input(kubernetes_version or "").apply(lambda version: version.removeprefix("v") or None),
+        config_patches=get_role_config_patches(role, tuning),
         docs=False,
         examples=False,
     )
-
-    return config
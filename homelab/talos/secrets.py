@@ -1,5 +1,8 @@
+import functools
+
+import pulumi
 import pulumiverse_talos as talos
-from config.settings import cluster_settings
+from config.settings import get_cluster_settings
 
 
 def generate_machine_secrets() -> talos.machine.Secrets:
@@ -13,13 +16,19 @@ def generate_machine_secrets() -> talos.machine.Secrets:
 
     The secrets are generated once and reused across all node configurations.
     """
+    cluster_settings = get_cluster_settings()
     secrets = talos.machine.Secrets(
         "talos-secrets",
         talos_version=cluster_settings.talos_version,
+        # A new talos_version would regenerate the whole PKI, upgrades must keep it
+        opts=pulumi.ResourceOptions(ignore_changes=["talosVersion"]),
     )
 
     return secrets
 
 
-# Singleton secrets instance - reused across all configurations
-machine_secrets = generate_machine_secrets()
+
+@functools.cache
+def get_machine_secrets() -> talos.machine.Secrets:
+    """The cluster's machine secrets, created on first use and reused across all configurations."""
+    return generate_machine_secrets()
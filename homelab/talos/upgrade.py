@@ -0,0 +1,185 @@
+import os
+import re
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pulumi
+import pulumi.dynamic
+import pulumi_proxmoxve as proxmoxve
+from config.settings import get_cluster_settings
+from config.nodes import CONTROL_PLANE_NODES, WORKER_NODES
+from infrastructure.addresses import node_ip
+from infrastructure.iso import get_talos_installer_image
+from talos.secrets import get_machine_secrets
+
+
+class ClusterUpgradeProvider(pulumi.dynamic.ResourceProvider):
+    """
+    Rolls Talos and Kubernetes version changes through the cluster with talosctl.
+
+    - Control planes are upgraded one at a time, and the next one only starts once
+      etcd reports every member healthy again.
+    - Workers are upgraded in batches of `worker_batch` at once. The Talos upgrade
+      sequence cordons and drains each node before rebooting it and uncordons it
+      afterwards.
+    - Kubernetes is upgraded last with `talosctl upgrade-k8s`, which rolls the
+      control plane components itself.
+
+    Nodes already at the target version are skipped, so a failed rollout can just
+    be retried. Creating the resource only records the versions: a new cluster is
+    installed at the right version to begin with.
+    """
+
+    def _talosctl(self, props: dict[str, Any], *args: str, timeout: float = 60) -> str:
+        with tempfile.TemporaryDirectory() as workdir:
+            talosconfig = os.path.join(workdir, "talosconfig")
+            with open(talosconfig, "w") as f:
+                f.write(props["talosconfig"])
+            result = subprocess.run(
+                ["talosctl", "--talosconfig", talosconfig, "--endpoints", ",".join(props["endpoints"]), *args],
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+        if result.returncode != 0:
+            raise Exception(f"talosctl {' '.join(args)} failed: {result.stderr.strip() or result.stdout.strip()}")
+        return result.stdout
+
+    def _node_version(self, props: dict[str, Any], ip: str) -> str:
+        # The server section of `talosctl version` is last, its Tag is the installed version
+        tags = re.findall(r"^\s*Tag:\s*(\S+)", self._talosctl(props, "--nodes", ip, "version"), re.MULTILINE)
+        return tags[-1] if tags else ""
+
+    def _wait_for_etcd(self, props: dict[str, Any]) -> None:
+        control_plane_ips = [node["ip"] for node in props["nodes"] if node["role"] == "controlplane"]
+        deadline = time.monotonic() + props["timeout"]
+        while True:
+            try:
+                status = self._talosctl(props, "--nodes", ",".join(control_plane_ips), "etcd", "status")
+                # A header line, then one line per member; members with errors list them in the last column
+                rows = [line for line in status.splitlines()[1:] if line.strip()]
+                if len(rows) == len(control_plane_ips) and not any("error" in line.lower() for line in rows):
+                    return
+            except Exception as e:
+                pulumi.log.debug(f"etcd not healthy yet: {e}")
+            if time.monotonic() > deadline:
+                raise Exception(f"etcd did not become healthy within {props['timeout']}s")
+            time.sleep(10)
+
+    def _upgrade_node(self, props: dict[str, Any], node: dict[str, Any]) -> None:
+        if self._node_version(props, node["ip"]) == props["talos_version"]:
+            return
+        pulumi.log.info(f"Upgrading {node['name']} to Talos {props['talos_version']}")
+        self._talosctl(
+            props, "--nodes", node["ip"], "upgrade",
+            "--image", props["installer_image"],
+            "--wait", "--timeout", f"{int(props['timeout'])}s",
+            timeout=props["timeout"] + 60,
+        )
+
+    def _upgrade(self, olds: dict[str, Any], news: dict[str, Any]) -> None:
+        if olds.get("talos_version") != news["talos_version"] or olds.get("installer_image") != news["installer_image"]:
+            for node in [node for node in news["nodes"] if node["role"] == "controlplane"]:
+                self._wait_for_etcd(news)
+                self._upgrade_node(news, node)
+            self._wait_for_etcd(news)
+
+            workers = [node for node in news["nodes"] if node["role"] == "worker"]
+            batch_size = max(1, int(news["worker_batch"]))
+            with ThreadPoolExecutor(max_workers=batch_size) as pool:
+                for i in range(0, len(workers), batch_size):
+                    # list() waits for the whole batch and raises the first failure
+                    list(pool.map(lambda node: self._upgrade_node(news, node), workers[i:i + batch_size]))
+
+        if news["kubernetes_version"] and olds.get("kubernetes_version") != news["kubernetes_version"]:
+            first_control_plane = next(node for node in news["nodes"] if node["role"] == "controlplane")
+            pulumi.log.info(f"Upgrading Kubernetes to {news['kubernetes_version']}")
+            self._talosctl(
+                news, "--nodes", first_control_plane["ip"], "upgrade-k8s",
+                "--to", news["kubernetes_version"].removeprefix("v"),
+                timeout=news["timeout"] * len(news["nodes"]),
+            )
+
+    def create(self, props: dict[str, Any]) -> pulumi.dynamic.CreateResult:
+        return pulumi.dynamic.CreateResult("cluster-upgrade", props)
+
+    def diff(self, _id: str, olds: dict[str, Any], news: dict[str, Any]) -> pulumi.dynamic.DiffResult:
+        changes = [key for key in ("talos_version", "installer_image", "kubernetes_version") if olds.get(key) != news.get(key)]
+        return pulumi.dynamic.DiffResult(changes=bool(changes), replaces=[], delete_before_replace=False)
+
+    def update(self, _id: str, olds: dict[str, Any], news: dict[str, Any]) -> pulumi.dynamic.UpdateResult:
+        self._upgrade(olds, news)
+        return pulumi.dynamic.UpdateResult(news)
+
+
+class ClusterUpgrade(pulumi.dynamic.Resource):
+    """The Talos and Kubernetes versions rolled out to the cluster."""
+
+    talos_version: pulumi.Output[str]
+    installer_image: pulumi.Output[str]
+    kubernetes_version: pulumi.Output[str]
+
+    def __init__(self, name: str, props: dict[str, Any], opts: pulumi.ResourceOptions | None = None):
+        super().__init__(
+            ClusterUpgradeProvider(),
+            name,
+            props,
+            pulumi.ResourceOptions.merge(pulumi.ResourceOptions(additional_secret_outputs=["talosconfig"]), opts),
+        )
+
+
+def create_cluster_upgrade(
+    control_plane_vms: list[proxmoxve.vm.VirtualMachine],
+    worker_vms: list[proxmoxve.vm.VirtualMachine],
+) -> ClusterUpgrade:
+    """
+    Create the resource that owns the cluster's Talos and Kubernetes versions.
+
+    Machine configurations are generated from its outputs rather than straight from
+    `cluster_settings`, so a version bump is first rolled out node by node here and
+    only then shows up in the configs, by which point every node already runs it.
+
+    Args:
+        control_plane_vms: Control plane VMs, in CONTROL_PLANE_NODES order
+        worker_vms: Worker VMs, in WORKER_NODES order
+
+    Returns:
+        ClusterUpgrade resource
+    """
+    cluster_settings = get_cluster_settings()
+    machine_secrets = get_machine_secrets()
+    nodes = [
+        {"name": node.name, "role": node.role, "ip": node_ip(node, vm)}
+        for node, vm in zip(CONTROL_PLANE_NODES + WORKER_NODES, control_plane_vms + worker_vms)
+    ]
+    control_plane_ips = [node["ip"] for node in nodes if node["role"] == "controlplane"]
+    talosconfig = pulumi.Output.all(
+        machine_secrets.client_configuration.ca_certificate,
+        machine_secrets.client_configuration.client_certificate,
+        machine_secrets.client_configuration.client_key,
+    ).apply(
+        lambda args: f"""context: {cluster_settings.name}
+contexts:
+  {cluster_settings.name}:
+    ca: {args[0]}
+    crt: {args[1]}
+    key: {args[2]}
+"""
+    )
+
+    return ClusterUpgrade(
+        "cluster-upgrade",
+        {
+            "talos_version": cluster_settings.talos_version,
+            "installer_image": get_talos_installer_image(cluster_settings.talos_version),
+            "kubernetes_version": cluster_settings.kubernetes_version,
+            "nodes": nodes,
+            "endpoints": control_plane_ips,
+            "talosconfig": pulumi.Output.secret(talosconfig),
+            "worker_batch": cluster_settings.worker_upgrade_batch,
+            "timeout": cluster_settings.upgrade_timeout,
+        },
+    )
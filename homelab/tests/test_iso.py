@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("pulumi_proxmoxve")
+
+from infrastructure.iso import GET_FILE_TOKEN, is_file_not_found  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        f"invoke of {GET_FILE_TOKEN} failed: File not found (talos-v1.9.0-7d4c31cbd96d-amd64.iso)",
+        f"invoke of {GET_FILE_TOKEN} failed: file 'talos-v1.9.0-7d4c31cbd96d-amd64.iso' not found in datastore local ()",
+    ],
+)
+def test_missing_file_is_a_cache_miss(message):
+    assert is_file_not_found(Exception(message))
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        f"invoke of {GET_FILE_TOKEN} failed: authentication failure (401)",
+        f"invoke of {GET_FILE_TOKEN} failed: dial tcp 192.168.0.71:8006: connect: connection refused ()",
+        f"invoke of {GET_FILE_TOKEN} failed: storage 'nfs-iso' does not exist ()",
+        "invoke of proxmoxve:storage/getDatastores:getDatastores failed: node not found ()",
+        "Some unrelated failure",
+    ],
+)
+def test_other_failures_propagate(message):
+    assert not is_file_not_found(Exception(message))
@@ -58,6 +58,8 @@ def create_postgres_cluster(
     enable_superuser: bool = False,
     postgres_version: str = "17",
     resources: dict = None,
+    shared_buffers: str = "256MB",
+    hugepages: str = None,
 ) -> k8s.apiextensions.CustomResource:
     """
     Create a CloudNativePG PostgreSQL Cluster.
@@ -73,6 +75,12 @@ def create_postgres_cluster(
         enable_superuser: Whether to enable superuser access
         postgres_version: PostgreSQL major version
         resources: Resource requests/limits dict
+        shared_buffers: PostgreSQL shared_buffers
+        hugepages: Amount of 2MB hugepages to request, e.g. "512Mi", None for normal pages.
+            Must cover shared_buffers plus a little for Postgres' other shared memory.
+            Pods then only schedule on nodes with hugepages-2Mi capacity (the homelab's
+            database pool), and huge_pages=on makes Postgres fail to start rather than
+            silently fall back to 4K pages.
 
     Returns:
         The created Cluster CustomResource
@@ -98,11 +106,22 @@ def create_postgres_cluster(
         "postgresql": {
             "parameters": {
                 "max_connections": "100",
-                "shared_buffers": "256MB",
+                "shared_buffers": shared_buffers,
             },
         },
     }
 
+    if hugepages:
+        cluster_spec["postgresql"]["parameters"]["huge_pages"] = "on"
+        resources = {
+            "requests": dict((resources or {}).get("requests", {})),
+            "limits": dict((resources or {}).get("limits", {})),
+        }
+        # Hugepage requests must equal limits, and Kubernetes rejects them without a memory or CPU request
+        resources["requests"]["hugepages-2Mi"] = hugepages
+        resources["limits"]["hugepages-2Mi"] = hugepages
+        resources["requests"].setdefault("memory", "512Mi")
+
     if resources:
         cluster_spec["resources"] = resources
 